@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# decoding benchmarks from the source tree, same as the lsdreader bench:
+#
+#   python benchmarks/run.py -d benchmarks/data -o benchmarks/current.json
+#   python benchmarks/run.py -d benchmarks/data --compare benchmarks/baseline.json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lingvoreader import bench
+
+__author__ = 'sv99'
+
+
+if __name__ == '__main__':
+    sys.exit(bench.main())
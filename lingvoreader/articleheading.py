@@ -81,6 +81,11 @@ __author__ = 'svolkov'
 # The headings that can't be collapsed using one of these three rules are left as is.
 #
 #
+def heading_key(text):
+    """ headings sorted case insensitive """
+    return text.lower()
+
+
 class CharInfo:
     def __init__(self):
         self.sorted = False
@@ -0,0 +1,317 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import argparse
+import bisect
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+from lingvoreader import __version__
+from lingvoreader import lsdwriter
+from lingvoreader.bitstream import BitStream, ByteBitStream
+from lingvoreader.lentable import LenTable
+from lingvoreader.lsdfile import LsdFile, xor_decode_x6
+from lingvoreader.profiler import Profile
+
+__author__ = 'sv99'
+
+
+# throughput of the hot components and the whole unpacking
+# on the synthetic dictionaries from the lsdwriter, best of the repeat runs
+#   MB/s - encoded input bytes, output bytes for the write_dsl
+#   symbols/s - fields for the bitstream, huffman symbols for the rest
+
+ENTRIES = 5000
+REPEAT = 3
+SEED = 1
+# allowed throughput drop against the baseline
+THRESHOLD = 0.1
+
+_BITS_DATA_SIZE = 1 << 18
+_READ_WIDTHS = (1, 3, 5, 8, 11, 13, 16, 20, 24, 32)
+_ARRAY_WIDTH = 13
+_LENTABLE_SYMBOLS = 512
+_LENTABLE_COUNT = 200000
+_XOR_DATA_SIZE = 1 << 22
+
+
+def measure(func, repeat):
+    """ best time of the repeat runs """
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        func()
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def result(seconds, size, symbols=None):
+    res = {
+        "seconds": seconds,
+        "bytes": size,
+        "mb_s": size / (1024 * 1024) / seconds if seconds else 0.0,
+    }
+    if symbols is not None:
+        res["symbols"] = symbols
+        res["symbols_s"] = symbols / seconds if seconds else 0.0
+    return res
+
+
+def random_bytes(size, seed=SEED):
+    rnd = random.Random(seed)
+    return bytes(bytearray(rnd.getrandbits(8) for _ in range(size)))
+
+
+def bench_bitstream(repeat):
+    data = bytearray(random_bytes(_BITS_DATA_SIZE))
+    widths = []
+    bits = 0
+    # stop before the end, BitStream and ByteBitStream differ after it
+    while bits + 2 * max(_READ_WIDTHS) < len(data) * 8:
+        width = _READ_WIDTHS[len(widths) % len(_READ_WIDTHS)]
+        widths.append(width)
+        bits += width
+    res = {}
+    for name, stream_type in (("bitstream.read_bits_o", ByteBitStream), ("bitstream.read_bits", BitStream)):
+        def run(stream_type=stream_type):
+            read_bits = stream_type(data).read_bits
+            for width in widths:
+                read_bits(width)
+        res[name] = result(measure(run, repeat), bits // 8, len(widths))
+    count = len(data) * 8 // _ARRAY_WIDTH - 1
+    res["bitstream.read_bits_array"] = result(
+        measure(lambda: BitStream(data).read_bits_array(count, _ARRAY_WIDTH), repeat),
+        count * _ARRAY_WIDTH // 8, count)
+    return res
+
+
+def bench_lentable(repeat):
+    """ zipf distributed symbols, canonical code from the lsdwriter """
+    rnd = random.Random(SEED)
+    weights = dict((i, 1000000 // (i + 1)) for i in range(_LENTABLE_SYMBOLS))
+    table = lsdwriter.LenTableWriter(weights)
+    bw = lsdwriter.BitWriter()
+    table.write(bw)
+    bw.align()
+    start = len(bw.data)
+    cumulative = []
+    total = 0
+    for i in range(_LENTABLE_SYMBOLS):
+        total += weights[i]
+        cumulative.append(total)
+    bits = 0
+    for _ in range(_LENTABLE_COUNT):
+        code, length = table.encode(bisect.bisect_right(cumulative, rnd.randrange(total)))
+        bw.write_bits(code, length)
+        bits += length
+    bstr = BitStream(bw.getvalue())
+    lt = LenTable(bstr)
+
+    def run_decode():
+        bstr.seek(start)
+        decode = lt.decode
+        for _ in range(_LENTABLE_COUNT):
+            decode()
+
+    def run_decode_many():
+        bstr.seek(start)
+        lt.decode_many(_LENTABLE_COUNT)
+
+    return {
+        "lentable.decode": result(measure(run_decode, repeat), bits // 8, _LENTABLE_COUNT),
+        "lentable.decode_many": result(measure(run_decode_many, repeat), bits // 8, _LENTABLE_COUNT),
+    }
+
+
+def bench_xor(repeat):
+    data = random_bytes(_XOR_DATA_SIZE)
+    return {"xor.decode_x6": result(measure(lambda: xor_decode_x6(data), repeat), len(data))}
+
+
+def make_dictionary(version, entries, work_dir):
+    """ generated once for the version, entries count and seed """
+    filename = os.path.join(work_dir, "bench_%x_%d_%d.lsd" % (version, entries, SEED))
+    if not os.path.exists(filename):
+        w = lsdwriter.LsdWriter(version, name="Bench %x" % version, annotation="Benchmark dictionary")
+        for headings, article in lsdwriter.random_corpus(entries, SEED):
+            w.add(headings, article)
+        w.write(filename + ".tmp")
+        os.rename(filename + ".tmp", filename)
+    return filename
+
+
+def counted(m, func):
+    """ profile counters of the single func run """
+    m.profile = Profile()
+    m.decoder.profile = m.profile
+    try:
+        func()
+    finally:
+        counters = m.profile.counters
+        m.profile = None
+        m.decoder.profile = None
+    return counters
+
+
+def unpack(filename, out_dir, profile=None):
+    with LsdFile(filename, profile=profile) as m:
+        m.parse_headings()
+        m.write(out_dir)
+
+
+def bench_dictionary(version, filename, out_dir, repeat):
+    name = hex(version)
+    res = {}
+    with LsdFile(filename) as m:
+        m.parse_headings()
+        pages = range(m.pages_count)
+
+        def run_headings():
+            for number in pages:
+                m.read_page(number)
+        counters = counted(m, run_headings)
+        res["headings." + name] = result(measure(run_headings, repeat), counters['bits'] // 8,
+                                         counters['symbols'])
+
+        for variant, decode in (("decode_article", m.read_article),
+                                ("decode_article_units", m.read_article_units)):
+            def run_articles(decode=decode):
+                for h in m.headings:
+                    decode(h)
+            counters = counted(m, run_articles)
+            res[variant + "." + name] = result(measure(run_articles, repeat), counters['bits'] // 8,
+                                               counters['symbols'])
+
+        # parsed dictionary, articles not decoded while writing
+        m.parse()
+        m.write_dsl(out_dir)
+        size = os.path.getsize(m.make_filename(out_dir, "dsl"))
+        res["write_dsl." + name] = result(measure(lambda: m.write_dsl(out_dir), repeat), size)
+
+    profile = Profile()
+    unpack(filename, out_dir, profile)
+    res["end_to_end." + name] = result(measure(lambda: unpack(filename, out_dir), repeat),
+                                       os.path.getsize(filename), profile.counters['symbols'])
+    return res
+
+
+# component benchmarks: (names, function)
+COMPONENTS = (
+    (("bitstream.read_bits_o", "bitstream.read_bits", "bitstream.read_bits_array"), bench_bitstream),
+    (("lentable.decode", "lentable.decode_many"), bench_lentable),
+    (("xor.decode_x6",), bench_xor),
+)
+# benchmarks for each dictionary version, named as name.version
+DICTIONARY_BENCHMARKS = ("headings", "decode_article", "decode_article_units", "write_dsl", "end_to_end")
+
+
+def run(versions=lsdwriter.SUPPORTED_VERSIONS, entries=ENTRIES, repeat=REPEAT, work_dir=None,
+        select=None, report=None):
+    """
+    benchmarks results: {name: result}, select - names substring,
+    report(name, result) called for each result
+    """
+    def selected(names):
+        return select is None or any(select in name for name in names)
+
+    results = {}
+
+    def add(res):
+        for name in sorted(res):
+            if selected((name,)):
+                results[name] = res[name]
+                if report is not None:
+                    report(name, res[name])
+
+    for names, func in COMPONENTS:
+        if selected(names):
+            add(func(repeat))
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp()
+    try:
+        out_dir = tempfile.mkdtemp(dir=work_dir)
+        for version in versions:
+            if selected([name + "." + hex(version) for name in DICTIONARY_BENCHMARKS]):
+                filename = make_dictionary(version, entries, work_dir)
+                add(bench_dictionary(version, filename, out_dir, repeat))
+        shutil.rmtree(out_dir)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    [(name, baseline MB/s, current MB/s, change, regression)] for the benchmarks in both,
+    regression - throughput dropped more than threshold
+    """
+    res = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        base = baseline[name]["mb_s"]
+        current = results[name]["mb_s"]
+        change = current / base - 1 if base else 0.0
+        res.append((name, base, current, change, change < -threshold))
+    return res
+
+
+def print_result(name, res):
+    line = "%-32s %9.2f MB/s" % (name, res["mb_s"])
+    if "symbols_s" in res:
+        line += " %12.0f symbols/s" % res["symbols_s"]
+    print(line)
+
+
+def get_arg_parser():
+    p = argparse.ArgumentParser(prog='lsdreader bench',
+                                description='Decoding throughput on the synthetic dictionaries')
+    p.add_argument("-n", "--entries", type=int, default=ENTRIES, help="Entries in the dictionaries")
+    p.add_argument("-r", "--repeat", type=int, default=REPEAT, help="Runs of each benchmark, best time used")
+    p.add_argument("-f", "--format", type=lambda value: int(value, 0), action="append",
+                   help="Dictionary version, all supported by default")
+    p.add_argument("-k", "--select", help="Only benchmarks with the substring in the name")
+    p.add_argument("-d", "--dir", help="Directory for the generated dictionaries, reused by the next runs")
+    p.add_argument("-o", "--output", help="Write results json")
+    p.add_argument("--compare", help="Baseline results json, regressions reported")
+    p.add_argument("--threshold", type=float, default=THRESHOLD,
+                   help="Allowed throughput drop against the baseline, 0.1 - 10%%")
+    return p
+
+
+def main(argv=None):
+    args = get_arg_parser().parse_args(argv)
+    if args.dir and not os.path.exists(args.dir):
+        os.makedirs(args.dir)
+    results = run(args.format or lsdwriter.SUPPORTED_VERSIONS, args.entries, args.repeat, args.dir,
+                  args.select, print_result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "lingvoreader": __version__,
+                "python": platform.python_version(),
+                "entries": args.entries,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+    if not args.compare:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)["results"]
+    print("Compare with %s:" % args.compare)
+    regressions = 0
+    for name, base, current, change, regression in compare(results, baseline, args.threshold):
+        print("%-32s %9.2f -> %9.2f MB/s %+7.1f%%%s" %
+              (name, base, current, change * 100, "  REGRESSION" if regression else ""))
+        regressions += regression
+    print("Regressions: %d" % regressions)
+    return 1 if regressions else 0
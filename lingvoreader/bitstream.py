@@ -1,10 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import binascii
 import struct
+from array import array
 
 from lingvoreader.tools import int2unichr
 from lingvoreader import LsdError
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __author__ = 'sv99'
 
 
@@ -32,7 +39,10 @@ def rec2int(rec, big_endian=True):
         return (ord(rec[3]) << 24) + (ord(rec[2]) << 16) + (ord(rec[1]) << 8) + ord(rec[0])
 
 
-class BitStream:
+class ByteBitStream:
+    """
+    byte at a time bit reader, reference implementation for the BitStream
+    """
     def __init__(self, record):
         """ record - bytearray! """
         self.record = record
@@ -44,6 +54,11 @@ class BitStream:
     def length(self):
         return len(self.record)
 
+    @property
+    def bit_pos(self):
+        """ absolute position in bits """
+        return (self.pos << 3) | self.in_byte_pos
+
     def seek(self, pos):
         self.pos = pos
         self.in_byte_pos = 0
@@ -92,13 +107,16 @@ class BitStream:
         self.in_byte_pos = 0
         return res
 
-    def read_symbols(self):
+    def read_symbols(self, xor=0):
         size = self.read_bits(32)
         bits_per_symbol = self.read_bits(8)
-        res = []
-        for i in range(size):
-            res.append(self.read_bits(bits_per_symbol))
-        return res
+        return self.read_bits_array(size, bits_per_symbol, xor)
+
+    def read_bits_array(self, count, width, xor=0):
+        """
+        count fields of the width bits, each xored with the xor: array('L')
+        """
+        return array('L', [self.read_bits(width) ^ xor for _ in range(count)])
 
     def read_bit(self):
         byte, = struct.unpack_from('B', self.record, self.pos)
@@ -169,6 +187,25 @@ class BitStream:
         self.pos = p
         return res
 
+    def peek_bits(self, count):
+        """
+        next count bits without moving, zero padded after the end of the record
+        """
+        if count > 32:
+            raise LsdError("Many bits for peek: %d" % count)
+        data = bytearray(self.record[self.pos:self.pos + 5])
+        res = 0
+        for i in range(5):
+            res <<= 8
+            if i < len(data):
+                res |= data[i]
+        return (res >> (40 - self.in_byte_pos - count)) & ((1 << count) - 1)
+
+    def skip_bits(self, count):
+        count += self.in_byte_pos
+        self.pos += count >> 3
+        self.in_byte_pos = count & 7
+
     def read_some(self, length):
         if length == 1:
             return self.read_byte()
@@ -190,3 +227,207 @@ class BitStream:
         return res
 
 
+_QWORD = struct.Struct('>Q')
+_MASKS = tuple((1 << i) - 1 for i in range(65))
+# bits unpacked from the single long integer by read_bits_array
+_ARRAY_CHUNK_BITS = 4096
+# fields count for the numpy unpacking, if available
+NUMPY_MIN_COUNT = 1024
+# accumulator start for the empty accumulator, any read refill it
+_EMPTY = -(1 << 62)
+
+
+class BitStream(ByteBitStream):
+    """
+    bit reader with the 64-bit accumulator refilled from the record,
+    same semantics as ByteBitStream
+    """
+    def __init__(self, record, base=0):
+        """
+        record - bytearray, bytes or mmap
+        base - absolute position of the record start, positions are absolute
+        """
+        self.record = record
+        self.base = base
+        self._bit = base << 3  # absolute bit position
+        self._acc = 0
+        self._acc_bit = _EMPTY  # bit position of the accumulator start, always byte aligned
+        return
+
+    @property
+    def length(self):
+        return self.base + len(self.record)
+
+    def attach(self, record, base=0):
+        """
+        read other record from the current position,
+        used for the decoded copy of the part of the file
+        """
+        self.record = record
+        self.base = base
+        self._acc_bit = _EMPTY
+
+    @property
+    def pos(self):
+        return self._bit >> 3
+
+    @pos.setter
+    def pos(self, value):
+        self._bit = (value << 3) | (self._bit & 7)
+        self._acc_bit = _EMPTY
+
+    @property
+    def in_byte_pos(self):
+        return self._bit & 7
+
+    @in_byte_pos.setter
+    def in_byte_pos(self, value):
+        self._bit = (self._bit & ~7) | value
+        self._acc_bit = _EMPTY
+
+    def _fill(self):
+        p = self._bit >> 3
+        try:
+            self._acc, = _QWORD.unpack_from(self.record, p - self.base)
+        except struct.error:
+            # tail of the record, pad with zeros
+            tail = bytearray(self.record[p - self.base:p - self.base + 8])
+            self._acc, = _QWORD.unpack(bytes(tail + bytearray(8 - len(tail))))
+        self._acc_bit = p << 3
+
+    def _read_bytes(self, bit_count):
+        """ bytes covering bit_count bits from the current position, zero padded """
+        p = (self._bit >> 3) - self.base
+        size = ((self._bit & 7) + bit_count + 7) >> 3
+        data = bytes(self.record[p:p + size])
+        if len(data) < size:
+            data += bytes(bytearray(size - len(data)))
+        return data
+
+    def seek(self, pos):
+        self._bit = pos << 3
+        self._acc_bit = _EMPTY
+        return pos < self.length
+
+    def read(self, length):
+        current = (self._bit >> 3) - self.base
+        self._bit += length << 3
+        return self.record[current:current + length]
+
+    def to_nearest_byte(self):
+        """
+        move to start next byte, if needed
+        """
+        self._bit = (self._bit + 7) & ~7
+
+    def read_byte(self):
+        p = self._bit >> 3
+        res, = struct.unpack_from('B', self.record, p - self.base)
+        self._bit = (p + 1) << 3
+        return res
+
+    def read_word(self):
+        p = self._bit >> 3
+        res, = struct.unpack_from('>H', self.record, p - self.base)
+        self._bit = (p + 2) << 3
+        return res
+
+    def read_int(self):
+        p = self._bit >> 3
+        res, = struct.unpack_from('>L', self.record, p - self.base)
+        self._bit = (p + 4) << 3
+        return res
+
+    def read_bit(self):
+        off = self._bit - self._acc_bit
+        if off >= 64:
+            self._fill()
+            off = self._bit & 7
+        self._bit += 1
+        return (self._acc >> (63 - off)) & 1
+
+    def read_bits(self, count):
+        if count > 32:
+            raise LsdError("Many bits for read: %d" % count)
+        off = self._bit - self._acc_bit
+        if off + count > 64:
+            self._fill()
+            off = self._bit & 7
+        self._bit += count
+        return (self._acc >> (64 - off - count)) & _MASKS[count]
+
+    read_bits_o = read_bits
+
+    def peek_bits(self, count):
+        """
+        next count bits without moving, zero padded after the end of the record
+        """
+        if count > 32:
+            raise LsdError("Many bits for peek: %d" % count)
+        off = self._bit - self._acc_bit
+        if off + count > 64:
+            self._fill()
+            off = self._bit & 7
+        return (self._acc >> (64 - off - count)) & _MASKS[count]
+
+    def skip_bits(self, count):
+        self._bit += count
+
+    # accumulator access for the inlined decoding loops (LenTable.decode_many):
+    # the count bits from the bit position are
+    #   (acc >> (64 - (bit - acc_bit) - count)) & ((1 << count) - 1)
+    # valid while bit - acc_bit + count <= 64, refill() otherwise,
+    # commit() the position before any other call of the reader
+
+    def accumulator(self):
+        """ current state: (bit, acc, acc_bit) """
+        return self._bit, self._acc, self._acc_bit
+
+    def refill(self, bit):
+        """ move to the bit position and reload the accumulator: (acc, acc_bit) """
+        self._bit = bit
+        self._fill()
+        return self._acc, self._acc_bit
+
+    def commit(self, bit):
+        """ move to the bit position, the accumulator is kept """
+        self._bit = bit
+
+    def read_bits_array(self, count, width, xor=0):
+        """
+        count fields of the width bits, each xored with the xor: array('L'),
+        unpacked from the long integers or with numpy for the long tables
+        """
+        if width > 32:
+            raise LsdError("Many bits for read: %d" % width)
+        if width == 0:
+            return array('L', [xor]) * count
+        if numpy is not None and count >= NUMPY_MIN_COUNT:
+            return self._read_bits_numpy(count, width, xor)
+        res = array('L')
+        mask = _MASKS[width]
+        per_chunk = max(1, _ARRAY_CHUNK_BITS // width)
+        while count > 0:
+            n = min(count, per_chunk)
+            bits = n * width
+            data = self._read_bytes(bits)
+            value = int(binascii.hexlify(data), 16) >> (len(data) * 8 - (self._bit & 7) - bits)
+            shifts = range(bits - width, -1, -width)
+            if xor:
+                res.extend([((value >> shift) & mask) ^ xor for shift in shifts])
+            else:
+                res.extend([(value >> shift) & mask for shift in shifts])
+            self._bit += bits
+            count -= n
+        return res
+
+    def _read_bits_numpy(self, count, width, xor):
+        bits = count * width
+        off = self._bit & 7
+        data = numpy.frombuffer(self._read_bytes(bits), dtype=numpy.uint8)
+        fields = numpy.unpackbits(data)[off:off + bits].reshape(count, width).astype(numpy.uint32)
+        values = fields.dot(numpy.left_shift(numpy.uint32(1), numpy.arange(width - 1, -1, -1, dtype=numpy.uint32)))
+        if xor:
+            values ^= numpy.uint32(xor)
+        self._bit += bits
+        return array('L', values.tolist())
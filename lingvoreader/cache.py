@@ -0,0 +1,142 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+from lingvoreader.index import _encode as _encode_text, _decode as _decode_text, _offsets, _uint32
+
+__author__ = 'sv99'
+
+
+# Decoded dictionary cache: decoder tables and headings index in the cache directory.
+# Cache valid while dictionary path, size, mtime and header checksum not changed.
+#
+# Data only format, nothing executed on load:
+#   magic, format, header size - '<8sLL'
+#   header - json: key, data with the arrays replaced by {"array": number}
+#            and the texts by {"text": number}, arrays sizes, texts count
+#   text offsets - texts count + 1 uint32
+#   texts - utf-8
+#   arrays - uint32 little endian
+# Values: json types (tuples stored as lists, str keys only), texts and array of the unsigned ints.
+# Any broken, stale or foreign file is the cache miss.
+
+CACHE_FORMAT = 3
+
+_MAGIC = b'LSDCACHE'
+_HEADER = struct.Struct('<8sLL')
+_ARRAY = 'array'
+_TEXT = 'text'
+
+
+def cache_key(dict_file, checksum):
+    st = os.stat(dict_file)
+    return [os.path.abspath(dict_file), st.st_size, st.st_mtime, checksum]
+
+
+def cache_file(cache_dir, dict_file):
+    name = hashlib.sha1(os.path.abspath(dict_file).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, name + '.cache')
+
+
+def _uint32_bytes(values):
+    res = array('I', values)
+    if sys.byteorder == 'big':
+        res.byteswap()
+    return res.tobytes() if hasattr(res, 'tobytes') else res.tostring()
+
+
+def _uint32_array(data):
+    res = array('I')
+    if hasattr(res, 'frombytes'):
+        res.frombytes(data)
+    else:
+        # python 2
+        res.fromstring(data)
+    if sys.byteorder == 'big':
+        res.byteswap()
+    return res
+
+
+def _encode(value, arrays, texts):
+    """ json value, arrays and texts moved to the lists """
+    if isinstance(value, array):
+        arrays.append(value)
+        return {_ARRAY: len(arrays) - 1}
+    if isinstance(value, type("")):
+        texts.append(_encode_text(value))
+        return {_TEXT: len(texts) - 1}
+    if isinstance(value, dict):
+        return dict((k, _encode(v, arrays, texts)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_encode(v, arrays, texts) for v in value]
+    return value
+
+
+def _decode(value, arrays, texts):
+    if isinstance(value, dict):
+        if list(value) == [_ARRAY]:
+            return arrays[value[_ARRAY]]
+        if list(value) == [_TEXT]:
+            return texts[value[_TEXT]]
+        return dict((k, _decode(v, arrays, texts)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_decode(v, arrays, texts) for v in value]
+    return value
+
+
+def _read(fp, size):
+    data = fp.read(size)
+    if len(data) != size:
+        raise EOFError("Truncated cache")
+    return data
+
+
+def load(cache_dir, dict_file, checksum):
+    """ cached data or None if not exists, broken or stale """
+    try:
+        with open(cache_file(cache_dir, dict_file), 'rb') as fp:
+            magic, fmt, size = _HEADER.unpack(fp.read(_HEADER.size))
+            if magic != _MAGIC or fmt != CACHE_FORMAT:
+                return None
+            header = json.loads(fp.read(size).decode('utf-8'))
+            if header['key'] != cache_key(dict_file, checksum):
+                return None
+            offsets = _uint32_array(_read(fp, 4 * (header['texts'] + 1)))
+            blob = _read(fp, offsets[-1])
+            texts = [_decode_text(blob[offsets[i]:offsets[i + 1]]) for i in range(header['texts'])]
+            arrays = [_uint32_array(_read(fp, 4 * count)) for count in header['arrays']]
+            return _decode(header['data'], arrays, texts)
+    except Exception:
+        # any garbage in the cache directory is the cache miss
+        return None
+
+
+def save(cache_dir, dict_file, checksum, data):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    arrays = []
+    texts = []
+    header = json.dumps({
+        'key': cache_key(dict_file, checksum),
+        'data': _encode(data, arrays, texts),
+        'arrays': [len(values) for values in arrays],
+        'texts': len(texts),
+    }).encode('utf-8')
+    path = cache_file(cache_dir, dict_file)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, 'wb') as fp:
+        fp.write(_HEADER.pack(_MAGIC, CACHE_FORMAT, len(header)))
+        fp.write(header)
+        fp.write(_uint32(_offsets(texts)))
+        fp.write(b"".join(texts))
+        for values in arrays:
+            fp.write(_uint32_bytes(values))
+    # atomic for the concurrent readers
+    getattr(os, 'replace', os.rename)(tmp, path)
+    return path
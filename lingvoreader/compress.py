@@ -0,0 +1,178 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import gzip
+import os
+import struct
+import time
+import zlib
+
+from lingvoreader import LsdError
+
+__author__ = 'sv99'
+
+
+# compressed dsl output: gzip or dictzip
+#
+# dictzip - gzip member with the RA extra field: chunks compressed with the
+# full flush, so each chunk inflated alone from the offset in the member
+#   RA: version(2) chunk length(2) chunks count(2) compressed chunk sizes(2 each)
+# header written before the data, so the maximal extra field reserved and
+# filled on the member end, rest of the field is the PD padding subfield.
+# Chunks count limited by the field size, next member started on overflow
+# (as idzip does), gzip and idzip read all members, dictd only first.
+
+GZIP = 'gz'
+DICTZIP = 'dz'
+FORMATS = (GZIP, DICTZIP)
+
+COMPRESS_LEVEL = 6
+# dictzip default
+CHUNK_LENGTH = 58315
+
+_XLEN = 0xFFFF
+# RA and PD subfields headers, RA version, length and count
+MAX_CHUNKS = (_XLEN - 4 - 6 - 4) // 2
+
+_FEXTRA = 4
+_FNAME = 8
+_FCOMMENT = 16
+
+
+def open_output(filename, compress=None):
+    """ binary output file, compress - None, GZIP or DICTZIP """
+    if compress is None:
+        return open(filename, 'wb')
+    if compress == GZIP:
+        return gzip.GzipFile(filename, 'wb', COMPRESS_LEVEL)
+    if compress == DICTZIP:
+        return DictzipFile(filename)
+    raise LsdError("Not supported compression: %s" % compress)
+
+
+class DictzipFile:
+    """ write only dictzip file, output must be seekable """
+    def __init__(self, filename, chunk_length=CHUNK_LENGTH, level=COMPRESS_LEVEL):
+        self.fp = open(filename, 'wb')
+        # name stored in the header without compression extension
+        name = os.path.basename(filename)
+        if name.endswith('.' + DICTZIP):
+            name = name[:-len(DICTZIP) - 1]
+        self.name = name.encode('latin-1', 'replace')
+        self.chunk_length = chunk_length
+        self.level = level
+        self._buffer = bytearray()
+        self._start_member()
+
+    def _start_member(self):
+        self._header_pos = self.fp.tell()
+        self._mtime = int(time.time())
+        self._sizes = []
+        self._crc = 0
+        self._size = 0
+        self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.fp.write(self._header())
+
+    def _header(self):
+        flags = _FEXTRA | (_FNAME if self.name else 0)
+        res = b'\x1f\x8b\x08' + struct.pack('<BIBB', flags, self._mtime, 0, 255)
+        res += struct.pack('<H', _XLEN) + self._extra()
+        if self.name:
+            res += self.name + b'\x00'
+        return res
+
+    def _extra(self):
+        count = len(self._sizes)
+        res = b'RA' + struct.pack('<HHHH', 6 + 2 * count, 1, self.chunk_length, count)
+        res += struct.pack('<%dH' % count, *self._sizes)
+        pad = _XLEN - len(res) - 4
+        return res + b'PD' + struct.pack('<H', pad) + bytes(bytearray(pad))
+
+    def _write_chunk(self, chunk, last):
+        data = self._compressor.compress(bytes(chunk))
+        data += self._compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+        self.fp.write(data)
+        self._sizes.append(len(data))
+        self._crc = zlib.crc32(chunk, self._crc)
+        self._size += len(chunk)
+
+    def _finish_member(self):
+        self.fp.write(struct.pack('<II', self._crc & 0xFFFFFFFF, self._size & 0xFFFFFFFF))
+        end = self.fp.tell()
+        self.fp.seek(self._header_pos)
+        self.fp.write(self._header())
+        self.fp.seek(end)
+
+    def write(self, data):
+        self._buffer += data
+        # the rest kept for the last chunk
+        while len(self._buffer) > self.chunk_length:
+            chunk = self._buffer[:self.chunk_length]
+            del self._buffer[:self.chunk_length]
+            if len(self._sizes) == MAX_CHUNKS - 1:
+                self._write_chunk(chunk, True)
+                self._finish_member()
+                self._start_member()
+            else:
+                self._write_chunk(chunk, False)
+        return len(data)
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        if self.fp is None:
+            return
+        self._write_chunk(self._buffer, True)
+        self._finish_member()
+        self.fp.close()
+        self.fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def dictzip_chunks(fp):
+    """
+    random access index of the dictzip file:
+    [(compressed offset, compressed size, chunk length)] for all members
+    """
+    res = []
+    fp.seek(0, os.SEEK_END)
+    file_size = fp.tell()
+    pos = 0
+    while pos < file_size:
+        fp.seek(pos)
+        header = fp.read(12)
+        magic, method, flags, xlen = struct.unpack('<2sBB6xH', header)
+        if magic != b'\x1f\x8b' or method != 8 or not flags & _FEXTRA:
+            raise LsdError("Not dictzip member at %d" % pos)
+        extra = fp.read(xlen)
+        if extra[:2] != b'RA':
+            raise LsdError("Not dictzip member at %d" % pos)
+        ver, chunk_length, count = struct.unpack_from('<HHH', extra, 4)
+        sizes = struct.unpack_from('<%dH' % count, extra, 10)
+        offset = pos + 12 + xlen
+        # zero terminated name and comment
+        fp.seek(offset)
+        for flag in (_FNAME, _FCOMMENT):
+            if flags & flag:
+                while fp.read(1) not in (b'\x00', b''):
+                    offset += 1
+                offset += 1
+        for size in sizes:
+            res.append((offset, size, chunk_length))
+            offset += size
+        # crc32 and size trailer
+        pos = offset + 8
+    return res
+
+
+def read_dictzip_chunk(fp, chunk):
+    """ uncompressed chunk, chunk - dictzip_chunks item """
+    offset, size, chunk_length = chunk
+    fp.seek(offset)
+    return zlib.decompressobj(-zlib.MAX_WBITS).decompress(fp.read(size))
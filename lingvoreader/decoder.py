@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import (division, absolute_import, print_function)
+import copy
+import sys
+from array import array
+
 from lingvoreader import tools
 from lingvoreader.lentable import LenTable
 from lingvoreader.tools import int2unichr
@@ -8,6 +12,37 @@ from lingvoreader.tools import int2unichr
 __author__ = 'sv99'
 
 
+def copy_back(res, start_idx, size):
+    """
+    back reference in the decoded buffer, truncated on the buffer end
+    as the substr in the LingvoEngine (lsd2dsl)
+    """
+    return res[start_idx:start_idx + size]
+
+
+def utf16_units(text):
+    """ UTF-16 code units of the text: array('H'), surrogate pairs outside BMP """
+    res = array('H')
+    data = text.encode('utf-16-le', 'surrogatepass')
+    if hasattr(res, 'frombytes'):
+        res.frombytes(data)
+    else:
+        # python 2
+        res.fromstring(data)
+    if sys.byteorder == 'big':
+        res.byteswap()
+    return res
+
+
+# article symbol kinds in the decode plan
+LITERAL = 0
+PREFIX_REF = 1
+BACK_REF = 2
+
+# shorter headings decoded by the single symbols
+HEADING_RUN_MIN = 8
+
+
 class Decoder:
     def __init__(self, bstr):
         self.bstr = bstr
@@ -20,12 +55,38 @@ class Decoder:
         self._ltPostfixLengths = None
         self._huffman1Number = 0
         self._huffman2Number = 0
+        # decode plan, build_plan() after read
+        self._heading_chars = None
+        self._article_values = None
+        self._article_units = None
+        self._prefix_units = None
+        self._article_kinds = None
+        self._article_sizes = None
+        self._prefix_bits = 0
+        self._reference1_bits = 0
+        self._reference2_bits = 0
         self._readed = False
+        # profiler.Profile, symbols and back references counted when set
+        self.profile = None
 
     @property
     def readed(self):
         return self._readed
 
+    def bind(self, bstr):
+        """
+        decoder reading the other bstr, tables and plan shared,
+        for the concurrent readers over the same buffer, not profiled
+        """
+        res = copy.copy(self)
+        res.bstr = bstr
+        res.profile = None
+        for name in ('_ltArticles', '_ltHeadings', '_ltPrefixLengths', '_ltPostfixLengths'):
+            table = getattr(self, name)
+            if table is not None:
+                setattr(res, name, table.bind(bstr))
+        return res
+
     def decode_prefix_len(self):
         return self._ltPrefixLengths.decode()
 
@@ -33,51 +94,147 @@ class Decoder:
         return self._ltPostfixLengths.decode()
 
     def read_reference1(self):
-        return self.read_reference(self._huffman1Number)
+        return self._read_reference(self._reference1_bits)
 
     def read_reference2(self):
-        return self.read_reference(self._huffman2Number)
+        return self._read_reference(self._reference2_bits)
 
     def read_reference(self, huffman_number):
+        return self._read_reference(tools.bit_length(huffman_number))
+
+    def _read_reference(self, size):
         reference = ""
         code = self.bstr.read_bits(2)
         if code == 3:
             self.bstr.read_bits(32)
             return reference
 
-        size = tools.bit_length(huffman_number)
         assert(size >= 2)
         return (code << (size - 2)) | self.bstr.read_bits(size - 2)
 
     def decode_heading(self, size):
-        res = ""
-        for i in range(size):
-            sym_idx = self._ltHeadings.decode()
-            sym = self._heading_symbols[sym_idx]
-            assert(sym <= 0xffff)  # LingvoEngine:2EAB84E8
-            res += int2unichr(sym)
-        return res
+        chars = self._heading_chars
+        if size < HEADING_RUN_MIN:
+            decode = self._ltHeadings.decode
+            res = [chars[decode()] for _ in range(size)]
+        else:
+            res = [chars[sym_idx] for sym_idx in self._ltHeadings.decode_many(size)]
+        assert(None not in res)  # LingvoEngine:2EAB84E8
+        if self.profile is not None:
+            # prefix and postfix lengths symbols too
+            self.profile.count('symbols', size + 2)
+        return "".join(res)
+
+    def article_symbol(self, sym):
+        """
+        User and Abrv dict: (kind, literal or reference length)
+        """
+        if sym >= 0x10000:
+            if sym >= 0x10040:
+                return BACK_REF, sym - 0x1003d
+            return PREFIX_REF, sym - 0xfffd
+        return LITERAL, int2unichr(sym)
+
+    def build_plan(self):
+        """ precomputed symbols tables and bit widths for the decode loops """
+        self._heading_chars = [int2unichr(sym) if sym <= 0xffff else None for sym in self._heading_symbols]
+        plan = [self.article_symbol(sym) for sym in self._article_symbols]
+        self._article_kinds = [kind for kind, value in plan]
+        self._article_sizes = [1 if kind == LITERAL else value for kind, value in plan]
+        # literal character or reference length
+        self._article_values = [value for kind, value in plan]
+        # literal UTF-16 code unit or reference length, None if literal or prefix outside BMP:
+        # references index characters, not code units
+        self._article_units = None
+        self._prefix_units = None
+        if all(kind != LITERAL or ord(value) <= 0xffff for kind, value in plan) and \
+                all(ord(ch) <= 0xffff for ch in self.prefix):
+            self._article_units = [ord(value) if kind == LITERAL else value for kind, value in plan]
+            self._prefix_units = array('H', [ord(ch) for ch in self.prefix])
+        self._prefix_bits = tools.bit_length(len(self.prefix))
+        self._reference1_bits = tools.bit_length(self._huffman1Number)
+        self._reference2_bits = tools.bit_length(self._huffman2Number)
 
     def decode_article(self, size):
+        # characters buffer, joined once at the end
+        res = []
+        self._decode_into(res, size, self._article_values, self.prefix)
+        return "".join(res)
+
+    def decode_article_units(self, size):
+        """ article as UTF-16 code units: array('H') """
+        if self._article_units is None:
+            return utf16_units(self.decode_article(size))
+        res = array('H')
+        self._decode_into(res, size, self._article_units, self._prefix_units)
+        return res
+
+    def _decode_into(self, res, size, values, prefix):
         """
-        decode User and Abrv dict
+        append decoded article to the res list or array,
+        values - literals and references lengths by the sym_idx, prefix - str or array
         """
-        res = ""
-        while len(res) < size:
-            sym_idx = self._ltArticles.decode()
-            sym = self._article_symbols[sym_idx]
-            if sym >= 0x10000:
-                if sym >= 0x10040:
-                    start_idx = self.bstr.read_bits(tools.bit_length(size))
-                    s = sym - 0x1003d
-                    res += res[start_idx:start_idx + s]
+        length = 0
+        symbols_count = 0
+        copies = 0
+        kinds = self._article_kinds
+        # field widths by the symbol kind
+        widths = (0, self._prefix_bits, tools.bit_length(size))
+        while length < size:
+            # references sizes without truncation, decoded again if truncated
+            symbols, fields = self._ltArticles.decode_until(
+                size - length, self._article_sizes, kinds, widths)
+            symbols_count += len(symbols)
+            field = iter(fields)
+            for sym_idx in symbols:
+                kind = kinds[sym_idx]
+                if kind == LITERAL:
+                    res.append(values[sym_idx])
+                    length += 1
+                    continue
+                if kind == BACK_REF:
+                    copies += 1
+                    chunk = copy_back(res, next(field), values[sym_idx])
                 else:
-                    prefix_idx = self.bstr.read_bits(tools.bit_length(len(self.prefix)))
-                    s = sym - 0xfffd
-                    res += self.prefix[prefix_idx:prefix_idx + s]
-            else:
-                res += int2unichr(sym)
-        return res
+                    prefix_idx = next(field)
+                    chunk = prefix[prefix_idx:prefix_idx + values[sym_idx]]
+                res.extend(chunk)
+                length += len(chunk)
+        if self.profile is not None:
+            self.profile.count('symbols', symbols_count)
+            self.profile.count('back_refs', copies)
+
+    def get_state(self):
+        """ decoded tables, plain python types """
+        return {
+            'prefix': self.prefix,
+            'article_symbols': self._article_symbols,
+            'heading_symbols': self._heading_symbols,
+            'articles': self._ltArticles.get_state(),
+            'headings': self._ltHeadings.get_state(),
+            'prefix_lengths': self._ltPrefixLengths.get_state(),
+            'postfix_lengths': self._ltPostfixLengths.get_state(),
+            'huffman1': self._huffman1Number,
+            'huffman2': self._huffman2Number,
+        }
+
+    def set_state(self, state):
+        """ restore get_state() result instead of read() """
+        self.prefix = state['prefix']
+        self._article_symbols = state['article_symbols']
+        self._heading_symbols = state['heading_symbols']
+        self._ltArticles = LenTable(self.bstr, state['articles'])
+        self._ltHeadings = LenTable(self.bstr, state['headings'])
+        self._ltPrefixLengths = LenTable(self.bstr, state['prefix_lengths'])
+        self._ltPostfixLengths = LenTable(self.bstr, state['postfix_lengths'])
+        self._huffman1Number = state['huffman1']
+        self._huffman2Number = state['huffman2']
+        self.build_plan()
+        self._readed = True
+
+    def max_article_symbol_bits(self, size):
+        """ upper bound of the bits for the one article symbol """
+        return self._ltArticles.max_length + max(tools.bit_length(len(self.prefix)), tools.bit_length(size))
 
     # need seek(bstr.header.dictionary_encoder_offset) befor call!
     def read(self):
@@ -111,6 +268,7 @@ class UserDictionaryDecoder(Decoder):
 
         self._huffman1Number = self.bstr.read_bits(32)
         self._huffman2Number = self.bstr.read_bits(32)
+        self.build_plan()
         self._readed = True
         return
 
@@ -132,26 +290,20 @@ class SystemDictionaryDecoder13(Decoder):
 
         self._huffman1Number = self.bstr.read_bits(32)
         self._huffman2Number = self.bstr.read_bits(32)
+        self.build_plan()
         self._readed = True
         return
 
-    def decode_article(self, size):
-        res = ""
-        while len(res) < size:
-            sym_idx = self._ltArticles.decode()
-            sym = self._article_symbols[sym_idx]
-            if sym <= 0x80:
-                if sym <= 0x3F:
-                    start_pref_idx = self.bstr.read_bits(tools.bit_length(len(self.prefix)))
-                    s = sym + 3
-                    res += self.prefix[start_pref_idx:start_pref_idx + s]
-                else:
-                    start_idx = self.bstr.read_bits(tools.bit_length(size))
-                    s = sym - 0x3d
-                    res += res[start_idx:start_idx + s]
-            else:
-                res += int2unichr(sym - 0x80)
-        return res
+    def article_symbol(self, sym):
+        """
+        System dict: 0..0x3F - prefix reference, 0x40..0x80 - back reference,
+        other - symbol + 0x80
+        """
+        if sym <= 0x80:
+            if sym <= 0x3F:
+                return PREFIX_REF, sym + 3
+            return BACK_REF, sym - 0x3d
+        return LITERAL, int2unichr(sym - 0x80)
 
 
 class SystemDictionaryDecoder14(SystemDictionaryDecoder13):
@@ -173,6 +325,7 @@ class SystemDictionaryDecoder14(SystemDictionaryDecoder13):
 
         self._huffman1Number = self.bstr.read_bits(32)
         self._huffman2Number = self.bstr.read_bits(32)
+        self.build_plan()
         self._readed = True
         return
 
@@ -212,16 +365,12 @@ class AbbreviationDictionaryDecoder(Decoder):
 
         self._huffman1Number = self.bstr.read_bits(32)
         self._huffman2Number = self.bstr.read_bits(32)
+        self.build_plan()
         self._readed = True
         return
 
     def read_xored_symbols(self):
-        size = self.bstr.read_bits(32)
-        bits_per_symbol = self.bstr.read_bits(8)
-        res = []
-        for i in range(size):
-            res.append(self.bstr.read_bits(bits_per_symbol) ^ 0x1325)
-        return res
+        return self.bstr.read_symbols(0x1325)
 
     def read_xored_prefix(self, size):
         res = ""
@@ -252,23 +401,17 @@ class SystemDictionaryDecoder15(Decoder):
 
         self._huffman1Number = self.bstr.read_bits(32)
         self._huffman2Number = self.bstr.read_bits(32)
+        self.build_plan()
         self._readed = True
         return
 
-    def decode_article(self, size):
-        res = ""
-        while len(res) < size:
-            sym_idx = self._ltArticles.decode()
-            sym = self._article_symbols[sym_idx]
-            if sym <= 0x80:
-                if sym <= 0x3F:
-                    start_pref_idx = self.bstr.read_bits(tools.bit_length(len(self.prefix)))
-                    s = sym + 3
-                    res += self.prefix[start_pref_idx:start_pref_idx + s]
-                else:
-                    start_idx = self.bstr.read_bits(tools.bit_length(size))
-                    s = sym - 0x3d
-                    res += res[start_idx:start_idx + s]
-            else:
-                res += int2unichr(sym - 0x80)
-        return res
+    def article_symbol(self, sym):
+        """
+        System dict: 0..0x3F - prefix reference, 0x40..0x80 - back reference,
+        other - symbol + 0x80
+        """
+        if sym <= 0x80:
+            if sym <= 0x3F:
+                return PREFIX_REF, sym + 3
+            return BACK_REF, sym - 0x3d
+        return LITERAL, int2unichr(sym - 0x80)
@@ -0,0 +1,222 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import mmap
+import os
+import struct
+
+from lingvoreader import LsdError
+from lingvoreader.articleheading import heading_key
+
+__author__ = 'sv99'
+
+
+# Headword index: sidecar file next to the dictionary, mapped read only,
+# headword found by the binary search over the sorted keys, only the article decoded.
+#
+#   header: magic, format, dictionary checksum and size, count, keys and texts size
+#   key offsets, text offsets, extensions offsets - count + 1 uint32
+#   references, next references - count uint32
+#   keys - heading_key utf-8 of the text, unsorted parts not matched as in the pages search,
+#          sorted, same keys in the file order
+#   texts - heading text utf-8
+#   extensions - unsorted parts: (idx, length, chars) utf-8
+#
+# Index stale when the dictionary checksum or size changed.
+
+INDEX_FORMAT = 2
+INDEX_EXT = '.idx'
+
+_MAGIC = b'LSDIDX\x00\x00'
+_HEADER = struct.Struct('<8sLLQLLL')
+
+
+def index_file(dict_file):
+    return dict_file + INDEX_EXT
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogatepass')
+
+
+def _decode(data):
+    return data.decode('utf-8', 'surrogatepass')
+
+
+def join_extensions(extensions):
+    """ unsorted parts [(idx, chars)] as the text, also used by the cache """
+    return "".join("%c%c%s" % (idx, len(ext), ext) for idx, ext in extensions)
+
+
+def split_extensions(text):
+    res = []
+    pos = 0
+    while pos < len(text):
+        size = ord(text[pos + 1])
+        res.append((ord(text[pos]), text[pos + 2:pos + 2 + size]))
+        pos += 2 + size
+    return res
+
+
+def _offsets(items):
+    """ offsets of the items in the joined blob, len(items) + 1 """
+    res = [0]
+    for item in items:
+        res.append(res[-1] + len(item))
+    return res
+
+
+def _uint32(values):
+    return struct.pack('<%dL' % len(values), *values)
+
+
+def write(path, headings, checksum, size):
+    """
+    index of the ArticleHeadingList: every heading of the merged items by the text,
+    checksum and size - dictionary header checksum and file size
+    """
+    entries = []
+    pos = 0
+    for item in headings:
+        for h in item.headings:
+            entries.append((_encode(heading_key(h.text)), pos, h, item))
+            pos += 1
+    entries.sort(key=lambda entry: (entry[0], entry[1]))
+    keys = [key for key, pos, h, item in entries]
+    texts = [_encode(h.text) for key, pos, h, item in entries]
+    extensions = [_encode(join_extensions(h.extensions)) for key, pos, h, item in entries]
+    references = [item.reference for key, pos, h, item in entries]
+    next_references = [item.next_reference for key, pos, h, item in entries]
+    keys_data = b"".join(keys)
+    texts_data = b"".join(texts)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp, 'wb') as fp:
+            fp.write(_HEADER.pack(_MAGIC, INDEX_FORMAT, checksum, size, len(entries),
+                                  len(keys_data), len(texts_data)))
+            for values in (_offsets(keys), _offsets(texts), _offsets(extensions), references, next_references):
+                fp.write(_uint32(values))
+            fp.write(keys_data)
+            fp.write(texts_data)
+            fp.write(b"".join(extensions))
+        # atomic for the concurrent readers
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except (IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+class HeadwordIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < _HEADER.size:
+                raise LsdError("Not headword index: %s" % path)
+            magic, fmt, self.checksum, self.size, self.count, keys_size, texts_size = \
+                _HEADER.unpack_from(self._mmap)
+            if magic != _MAGIC or fmt != INDEX_FORMAT:
+                raise LsdError("Not supported headword index: %s" % path)
+            count = self.count
+            self._key_offsets = _HEADER.size
+            self._text_offsets = self._key_offsets + 4 * (count + 1)
+            self._ext_offsets = self._text_offsets + 4 * (count + 1)
+            self._references = self._ext_offsets + 4 * (count + 1)
+            self._next_references = self._references + 4 * count
+            self._keys = self._next_references + 4 * count
+            self._texts = self._keys + keys_size
+            self._extensions = self._texts + texts_size
+            if self._extensions + self._offset(self._ext_offsets, count) != len(self._mmap):
+                raise LsdError("Broken headword index: %s" % path)
+        except LsdError:
+            self.close()
+            raise
+        except struct.error:
+            self.close()
+            raise LsdError("Broken headword index: %s" % path)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def stale(self, checksum, size):
+        """ built for other dictionary content """
+        return self.checksum != checksum or self.size != size
+
+    def _offset(self, table, idx):
+        return struct.unpack_from('<L', self._mmap, table + 4 * idx)[0]
+
+    def _string(self, table, base, idx):
+        start, end = struct.unpack_from('<LL', self._mmap, table + 4 * idx)
+        return self._mmap[base + start:base + end]
+
+    def key(self, idx):
+        return _decode(self._string(self._key_offsets, self._keys, idx))
+
+    def _find(self, key):
+        """ index of the first entry not less than key """
+        key = _encode(key)
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(self._key_offsets, self._keys, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entry(self, idx):
+        """ (text, extensions, reference, next_reference) """
+        return (
+            _decode(self._string(self._text_offsets, self._texts, idx)),
+            split_extensions(_decode(self._string(self._ext_offsets, self._extensions, idx))),
+            self._offset(self._references, idx),
+            self._offset(self._next_references, idx),
+        )
+
+    def find(self, word):
+        """ entries for the word, case insensitive, in the dictionary order """
+        key = heading_key(word)
+        encoded = _encode(key)
+        res = []
+        idx = self._find(key)
+        while idx < self.count and self._string(self._key_offsets, self._keys, idx) == encoded:
+            res.append(self.entry(idx))
+            idx += 1
+        return res
+
+    def prefix(self, prefix, limit=None):
+        """ entries with the text started with the prefix, case insensitive, first limit (None - all) """
+        encoded = _encode(heading_key(prefix))
+        res = []
+        idx = self._find(heading_key(prefix))
+        while idx < self.count and (limit is None or len(res) < limit) and \
+                self._string(self._key_offsets, self._keys, idx).startswith(encoded):
+            res.append(self.entry(idx))
+            idx += 1
+        return res
+
+def load(path, checksum, size):
+    """ mapped index or None if not exists, broken or stale """
+    try:
+        res = HeadwordIndex(path)
+    except (IOError, OSError, ValueError, LsdError):
+        return None
+    if res.stale(checksum, size):
+        res.close()
+        return None
+    return res
@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import (print_function)
+import copy
+import heapq
+from array import array
+
 from . import tools
+from lingvoreader import LsdError
+from lingvoreader.bitstream import BitStream
 
 __author__ = 'sv99'
 
@@ -13,82 +19,299 @@ class SymInfo:
         self.code = code
 
 
-class HuffmanNode:
-    def __init__(self, left, right, parent, weight):
-        self.left = left
-        self.right = right
-        self.parent = parent
-        self.weight = weight
+# lookup table entry: (sym_idx << 5) | code length for the leaf,
+# (subtable index << 5) for the longer codes, 0 for the unused code
+ENTRY_LEN_MASK = 0x1F
 
 
 class LenTable:
-    def __init__(self, bstr):
+    # bits resolved by the single lookup table hit
+    TABLE_BITS = 10
+
+    def __init__(self, bstr, state=None):
+        """
+        state - get_state() result, table restored without reading bstr
+        """
         self.bstr = bstr
-        self._count = self.bstr.read_bits(32)
-        self._bits_per_len = self.bstr.read_bits(8)
-        self._idx_bit_size = tools.bit_length(self._count)
-
-        self.symidx2nodeidx = [-1 for _ in range(self._count)]
-        self.nodes = [HuffmanNode(0, 0, -1, -1) for _ in range(self._count - 1)]
-        root_idx = len(self.nodes) - 1
-        self.next_node_position = 0
-        for i in range(self._count):
-            symidx = self.bstr.read_bits(self._idx_bit_size)
-            length = self.bstr.read_bits(self._bits_per_len)
-            self.place_sym_idx(symidx, root_idx, length)
-
-    def place_sym_idx(self, sym_idx, node_idx, size):
-        assert size > 0
-        if size == 1:  # time to place
-            if self.nodes[node_idx].left == 0:
-                self.nodes[node_idx].left = -1 - sym_idx
-                self.symidx2nodeidx[sym_idx] = node_idx
-                return True
-
-            if self.nodes[node_idx].right == 0:
-                self.nodes[node_idx].right = -1 - sym_idx
-                self.symidx2nodeidx[sym_idx] = node_idx
-                return True
-
-            return False
-
-        if self.nodes[node_idx].left == 0:
-            self.nodes[self.next_node_position] = HuffmanNode(0, 0, node_idx, -1)
-            self.next_node_position += 1
-            self.nodes[node_idx].left = self.next_node_position
-
-        if self.nodes[node_idx].left > 0:
-            if self.place_sym_idx(sym_idx, self.nodes[node_idx].left - 1, size - 1):
-                return True
-
-        if self.nodes[node_idx].right == 0:
-            self.nodes[self.next_node_position] = HuffmanNode(0, 0, node_idx, -1)
-            self.next_node_position += 1
-            self.nodes[node_idx].right = self.next_node_position
-
-        if self.nodes[node_idx].right > 0:
-            if self.place_sym_idx(sym_idx, self.nodes[node_idx].right - 1, size - 1):
-                return True
-
-        return False
+        if state is None:
+            self._count = self.bstr.read_bits(32)
+            self._bits_per_len = self.bstr.read_bits(8)
+            self._idx_bit_size = tools.bit_length(self._count)
+            # (symidx, code length) in the file order
+            width = self._idx_bit_size + self._bits_per_len
+            if width <= 32:
+                # entry read as the single field
+                len_mask = (1 << self._bits_per_len) - 1
+                self._lengths = [(entry >> self._bits_per_len, entry & len_mask)
+                                 for entry in self.bstr.read_bits_array(self._count, width)]
+            else:
+                self._lengths = []
+                for i in range(self._count):
+                    symidx = self.bstr.read_bits(self._idx_bit_size)
+                    length = self.bstr.read_bits(self._bits_per_len)
+                    self._lengths.append((symidx, length))
+        else:
+            self._count, self._bits_per_len, self._lengths = state[:3]
+            self._idx_bit_size = tools.bit_length(self._count)
+        self._max_len = max([length for symidx, length in self._lengths] or [0])
+        # tree built on demand, restored state has the lookup tables
+        self._left = None
+
+        # tables[0] - root table
+        self._tables = []
+        self._table_bits = []
+        if state is not None and len(state) > 3:
+            entries, table_bits = state[3]
+            pos = 0
+            for bits in table_bits:
+                self._tables.append(list(entries[pos:pos + (1 << bits)]))
+                self._table_bits.append(bits)
+                pos += 1 << bits
+        else:
+            if self._count > 1:
+                self._build_tree()
+                self._build_table(self._root_idx)
+            else:
+                # no codes, each decode fails as the invalid code
+                self._tables.append([0])
+                self._table_bits.append(0)
+        self._table = self._tables[0]
+        self._root_bits = self._table_bits[0]
+
+    def _build_tree(self):
+        """ tree in the flat arrays, child: node index + 1, -1 - sym_idx for the leaf, 0 - empty """
+        nodes_count = max(self._count - 1, 0)
+        self._left = array('i', [0]) * nodes_count
+        self._right = array('i', [0]) * nodes_count
+        self._parent = array('i', [-1]) * nodes_count
+        self.symidx2nodeidx = array('i', [-1]) * self._count
+        self._place_codes(self.assign_codes(self._lengths))
+
+    @staticmethod
+    def assign_codes(lengths):
+        """
+        codes for the (sym_idx, length) in the file order: [(sym_idx, code, length)],
+        each code is the leftmost free code of the length, as LingvoEngine
+        places symbols in the tree. Symbols without free code skipped.
+
+        Free codes are the disjoint blocks, kept by the depth in the heaps:
+        leftmost free code of the length is the leftmost block not longer
+        then the length, the rest of the block splitted into the free blocks.
+        """
+        free = [[0]]  # root block, empty code
+        res = []
+        for sym_idx, length in lengths:
+            assert length > 0
+            while len(free) <= length:
+                free.append([])
+            best = None
+            for depth in range(length + 1):
+                if free[depth]:
+                    code = free[depth][0] << (length - depth)
+                    if best is None or code < best[0]:
+                        best = code, depth
+            if best is None:
+                continue
+            code, depth = best
+            block = heapq.heappop(free[depth])
+            for i in range(depth + 1, length + 1):
+                heapq.heappush(free[i], (block << (i - depth)) | 1)
+            res.append((sym_idx, code, length))
+        return res
+
+    def _place_codes(self, codes):
+        """ tree nodes created in the same order as the LingvoEngine does """
+        left = self._left
+        right = self._right
+        self._root_idx = len(left) - 1
+        next_node_position = 0
+        for sym_idx, code, length in codes:
+            node_idx = self._root_idx
+            for shift in range(length - 1, 0, -1):
+                children = right if (code >> shift) & 1 else left
+                if children[node_idx] == 0:
+                    self._parent[next_node_position] = node_idx
+                    next_node_position += 1
+                    children[node_idx] = next_node_position
+                node_idx = children[node_idx] - 1
+            children = right if code & 1 else left
+            children[node_idx] = -1 - sym_idx
+            self.symidx2nodeidx[sym_idx] = node_idx
+
+    def get_state(self):
+        """ (count, bits_per_len, lengths, (joined lookup tables, tables bits)) """
+        entries = array('L')
+        for table in self._tables:
+            entries.extend(table)
+        return self._count, self._bits_per_len, self._lengths, (entries, array('L', self._table_bits))
+
+    def bind(self, bstr):
+        """ table decoding from the other bstr, lookup tables shared """
+        res = copy.copy(self)
+        res.bstr = bstr
+        return res
+
+    @property
+    def max_length(self):
+        """ longest code length """
+        return self._max_len
+
+    def _subtree_height(self, node_idx):
+        res = 0
+        stack = [(node_idx, 0)]
+        while stack:
+            idx, depth = stack.pop()
+            for child in (self._left[idx], self._right[idx]):
+                if child > 0:
+                    stack.append((child - 1, depth + 1))
+                else:
+                    res = max(res, depth + 1)
+        return res
+
+    def _build_table(self, node_idx):
+        """
+        lookup table for the subtree, codes longer than table width
+        continue in the subtables
+        """
+        width = min(self.TABLE_BITS, self._subtree_height(node_idx))
+        table = [0] * (1 << width)
+        table_idx = len(self._tables)
+        self._tables.append(table)
+        self._table_bits.append(width)
+        stack = [(node_idx, 0, 0)]
+        while stack:
+            idx, code, depth = stack.pop()
+            depth += 1
+            for bit, child in ((0, self._left[idx]), (1, self._right[idx])):
+                child_code = (code << 1) | bit
+                if child < 0:  # leaf
+                    shift = width - depth
+                    entry = ((-1 - child) << 5) | depth
+                    for i in range(child_code << shift, (child_code + 1) << shift):
+                        table[i] = entry
+                elif child > 0:
+                    if depth == width:
+                        table[child_code] = self._build_table(child - 1) << 5
+                    else:
+                        stack.append((child - 1, child_code, depth))
+        return table_idx
 
     def decode(self):
-        node = self.nodes[-1]
-        length = 0
+        entry = self._table[self.bstr.peek_bits(self._root_bits)]
+        length = entry & ENTRY_LEN_MASK
+        if length:
+            self.bstr.skip_bits(length)
+            return entry >> 5
+        return self._decode_long(entry)
+
+    def decode_many(self, count):
+        """ count symbols: array('L') """
+        res = array('L')
+        if not isinstance(self.bstr, BitStream):
+            res.extend([self.decode() for _ in range(count)])
+            return res
+        append = res.append
+        # BitStream.peek_bits and skip_bits inlined on the accumulator
+        bstr = self.bstr
+        table = self._table
+        root_bits = self._root_bits
+        mask = (1 << root_bits) - 1
+        bit, acc, acc_bit = bstr.accumulator()
+        for _ in range(count):
+            off = bit - acc_bit
+            if off + root_bits > 64:
+                acc, acc_bit = bstr.refill(bit)
+                off = bit - acc_bit
+            entry = table[(acc >> (64 - off - root_bits)) & mask]
+            length = entry & ENTRY_LEN_MASK
+            if length:
+                bit += length
+                append(entry >> 5)
+            else:
+                bstr.commit(bit)
+                append(self._decode_long(entry))
+                bit, acc, acc_bit = bstr.accumulator()
+        bstr.commit(bit)
+        return res
+
+    def decode_until(self, total, sizes, kinds, widths):
+        """
+        symbols until sum of the sizes[sym_idx] reach the total: (symbols, fields) arrays,
+        symbol followed by the field of the widths[kinds[sym_idx]] bits, if not zero
+        """
+        symbols = array('L')
+        fields = array('L')
+        bstr = self.bstr
+        if not isinstance(bstr, BitStream):
+            while total > 0:
+                sym_idx = self.decode()
+                symbols.append(sym_idx)
+                width = widths[kinds[sym_idx]]
+                if width:
+                    fields.append(bstr.read_bits(width))
+                total -= sizes[sym_idx]
+            return symbols, fields
+        append = symbols.append
+        append_field = fields.append
+        table = self._table
+        root_bits = self._root_bits
+        mask = (1 << root_bits) - 1
+        bit, acc, acc_bit = bstr.accumulator()
+        while total > 0:
+            off = bit - acc_bit
+            if off + root_bits > 64:
+                acc, acc_bit = bstr.refill(bit)
+                off = bit - acc_bit
+            entry = table[(acc >> (64 - off - root_bits)) & mask]
+            length = entry & ENTRY_LEN_MASK
+            if length:
+                bit += length
+                sym_idx = entry >> 5
+            else:
+                bstr.commit(bit)
+                sym_idx = self._decode_long(entry)
+                bit, acc, acc_bit = bstr.accumulator()
+            append(sym_idx)
+            total -= sizes[sym_idx]
+            width = widths[kinds[sym_idx]]
+            if width:
+                # BitStream.read_bits inlined
+                off = bit - acc_bit
+                if off + width > 64:
+                    acc, acc_bit = bstr.refill(bit)
+                    off = bit - acc_bit
+                append_field((acc >> (64 - off - width)) & ((1 << width) - 1))
+                bit += width
+        bstr.commit(bit)
+        return symbols, fields
+
+    def _decode_long(self, entry):
+        bits = self._root_bits
         while True:
-            length += 1
-            bit = self.bstr.read_bit()
-            if bit:  # right
-                if node.right < 0:  # leaf
-                    sym_idx = -1 - node.right
-                    return sym_idx
-                node = self.nodes[node.right - 1]
-            else:  # left
-                if node.left < 0:  # leaf
-                    sym_idx = -1 - node.left
-                    return sym_idx
+            if entry == 0:
+                raise LsdError("Invalid huffman code")
+            self.bstr.skip_bits(bits)
+            table_idx = entry >> 5
+            bits = self._table_bits[table_idx]
+            entry = self._tables[table_idx][self.bstr.peek_bits(bits)]
+            length = entry & ENTRY_LEN_MASK
+            if length:
+                self.bstr.skip_bits(length)
+                return entry >> 5
 
-                node = self.nodes[node.left - 1]
+    # tree walker, reference implementation for the decode
+    def decode_tree(self):
+        if self._left is None:
+            self._build_tree()
+        node_idx = self._root_idx
+        while True:
+            if self.bstr.read_bit():  # right
+                child = self._right[node_idx]
+            else:  # left
+                child = self._left[node_idx]
+            if child < 0:  # leaf
+                return -1 - child
+            node_idx = child - 1
 
     def dump(self, name):
         print("LenTable:              %s" % name)
@@ -1,13 +1,21 @@
 # coding: utf-8
 from __future__ import unicode_literals, print_function, division, absolute_import
 
+import bisect
 import codecs
+import mmap
 import os
+import struct
+import sys
+import threading
+from array import array
+from contextlib import contextmanager
 
 from lingvoreader import LsdError
-from lingvoreader import tools, decoder
-from lingvoreader.articleheading import ArticleHeading, ArticleHeadingList
+from lingvoreader import tools, decoder, parallel, cache, index, pipeline, profiler
+from lingvoreader.articleheading import ArticleHeading, ArticleHeadingList, Heading, heading_key
 from lingvoreader.bitstream import reverse32, reverse16, BitStream
+from lingvoreader.compress import open_output as compress_output
 
 __author__ = 'sv99'
 
@@ -63,6 +71,147 @@ class Header:
         print("    Target language:   %d %s" % (self.target_language, tools.lang_map[self.target_language]))
 
 
+# x5 and x6 dictionaries decoder by the full version
+_decoder_classes = {
+    0x142001: decoder.UserDictionaryDecoder,  # user dictionaries
+    0x141004: decoder.SystemDictionaryDecoder14,  # system dictionaries
+    0x145001: decoder.AbbreviationDictionaryDecoder,  # abbreviation dictionaries
+    0x152001: decoder.UserDictionaryDecoder,
+    0x151005: decoder.SystemDictionaryDecoder14,  # xor dictionary
+    0x155001: decoder.AbbreviationDictionaryDecoder,
+}
+
+
+def get_decoder_class(version):
+    """ decoder class for the dictionary version, None if not supported """
+    hi_version = version >> 16
+    if hi_version in (0x11, 0x12):  # lingvo 11 and 12 dictionary: 0x11001, 0x12001
+        return decoder.UserDictionaryDecoder
+    if hi_version == 0x13:  # x3 dictionary: 0x131001 and 0x132001 if pages count > 1000
+        return decoder.SystemDictionaryDecoder13
+    return _decoder_classes.get(version)
+
+
+class DictionaryInfo:
+    """ dictionary name, bounds headings, capitals and icon after the header """
+    def __init__(self, bstr, version, length):
+        """ length - file length, pages end for the dictionaries without overlay """
+        name_len = bstr.read_some(1)
+        self.name = bstr.read_unicode(name_len, False)
+        self.first_heading = bstr.read_unicode(bstr.read_byte(), False)
+        self.last_heading = bstr.read_unicode(bstr.read_byte(), False)
+        capitals_len = reverse32(bstr.read_int())
+        self.capitals = bstr.read_unicode(capitals_len, False)
+        # icon v12+
+        if version > 0x120000:
+            self.icon_size = reverse16(bstr.read_word())
+            self.icon = bstr.read(self.icon_size)
+        else:
+            self.icon_size = 0
+            self.icon = None
+
+        if version > 0x140000:
+            self.header_checksum = reverse32(bstr.read_int())
+        else:
+            self.header_checksum = 0
+
+        if version > 0x120000:
+            self.pages_end = reverse32(bstr.read_int())
+            self.overlay_data = reverse32(bstr.read_int())
+        else:
+            self.pages_end = length
+            self.overlay_data = length  # no overlay
+
+        if version > 0x140000:
+            self.dummy1 = reverse32(bstr.read_int())
+            self.dummy2 = reverse32(bstr.read_int())
+        else:
+            self.dummy1 = 0
+            self.dummy2 = 0
+
+
+# header and dictionary info are in the first bytes of the file
+PROBE_SIZE = 4096
+
+
+class Probe:
+    """
+    header and dictionary info read from the start of the file,
+    without xor decoding and decoder initialization
+    """
+    def __init__(self, dict_file):
+        self.filename = dict_file
+        with open(dict_file, 'rb') as fp:
+            self.file_size = os.fstat(fp.fileno()).st_size
+            data = fp.read(PROBE_SIZE)
+            while True:
+                bstr = BitStream(data)
+                try:
+                    self.header = Header(bstr)
+                    if self.header.magic != u'LingVo':
+                        raise LsdError('Allow only Lsd "LingVo" ident: %s' % repr(self.header.magic))
+                    self.info = DictionaryInfo(bstr, self.header.version, self.file_size)
+                    if bstr.pos <= len(data):
+                        break
+                except struct.error:
+                    pass
+                if len(data) >= self.file_size:
+                    raise LsdError("Truncated dictionary header: %s" % dict_file)
+                # large icon, read more and parse again
+                data += fp.read(len(data))
+        self.supported = get_decoder_class(self.header.version) is not None
+
+    @property
+    def xored(self):
+        return self.header.version == 0x151005
+
+    @property
+    def pages_count(self):
+        return (self.info.pages_end - self.header.pages_offset) // 512
+
+    def as_dict(self):
+        """ json serializable fields """
+        header = self.header
+        info = self.info
+        return {
+            "file": self.filename,
+            "size": self.file_size,
+            "version": hex(header.version),
+            "supported": self.supported,
+            "xored": self.xored,
+            "checksum": hex(header.checksum),
+            "entries": header.entries_count,
+            "source_language": header.source_language,
+            "source_language_name": tools.lang_map.get(header.source_language),
+            "target_language": header.target_language,
+            "target_language_name": tools.lang_map.get(header.target_language),
+            "name": info.name,
+            "first_heading": info.first_heading,
+            "last_heading": info.last_heading,
+            "capitals": info.capitals,
+            "icon_size": info.icon_size,
+            "annotation_offset": header.annotation_offset,
+            "dictionary_encoder_offset": header.dictionary_encoder_offset,
+            "articles_offset": header.articles_offset,
+            "pages_offset": header.pages_offset,
+            "pages_end": info.pages_end,
+            "pages_count": self.pages_count,
+            "overlay_data": info.overlay_data,
+        }
+
+    def dump(self):
+        self.header.dump()
+        print("Supported:             %s" % self.supported)
+        print("Name:                  %s" % self.info.name)
+        print("First heading:         %s" % self.info.first_heading)
+        print("Last heading:          %s" % self.info.last_heading)
+        print("Capitals:              %s" % self.info.capitals)
+        print("Pages end:             %s" % hex(self.info.pages_end))
+        print("Overlay data:          %s" % hex(self.info.overlay_data))
+        print("Pages count:           %d" % self.pages_count)
+        print("Icon enable:           %s" % (self.info.icon_size > 0))
+
+
 class CachePage:
     def __init__(self, bstr):
         self.bstr = bstr
@@ -76,6 +225,70 @@ class CachePage:
         return
 
 
+NO_PAGE = 0xFFFF
+
+
+class PageTree:
+    """
+    leaf pages in the dictionary order by the next links and the B-tree by the parent links,
+    read from the pages headers only. Internal pages separators not decoded (format not known):
+    child separator is the first heading of its leftmost leaf.
+    """
+    def __init__(self, cursor):
+        # page number from the header -> (page index in the file, CachePage)
+        pages = {}
+        for idx in range(cursor.pages_count):
+            cursor.bstr.seek(cursor.get_page_offset(idx))
+            page = CachePage(cursor.bstr)
+            pages[page.number] = idx, page
+        numbers = self._leaf_numbers(pages)
+        # page indexes of the leaves in the dictionary order
+        self.leaves = [pages[number][0] for number in numbers]
+        children = {}
+        roots = []
+        for number, (idx, page) in pages.items():
+            parent = pages.get(page.parent)
+            if parent is not None and not parent[1].is_leaf and page.parent != number:
+                children.setdefault(page.parent, []).append(number)
+            else:
+                roots.append(number)
+        positions = dict((number, pos) for pos, number in enumerate(numbers))
+        # node: [(leftmost leaf position, child node or None for the leaf), ..]
+        self.root = self._node(roots, pages, children, positions, set())
+
+    @staticmethod
+    def _leaf_numbers(pages):
+        """ leaf pages numbers by the next links from the first leaf, file order if links broken """
+        count = sum(1 for idx, page in pages.values() if page.is_leaf)
+        heads = [number for number, (idx, page) in pages.items() if page.is_leaf and page.prev == NO_PAGE]
+        res = []
+        if len(heads) == 1:
+            number = heads[0]
+            while number in pages and pages[number][1].is_leaf and len(res) <= count:
+                res.append(number)
+                number = pages[number][1].next
+        if len(res) != count or len(set(res)) != count:
+            res = [number for number, (idx, page) in sorted(pages.items(), key=lambda item: item[1][0])
+                   if page.is_leaf]
+        return res
+
+    def _node(self, numbers, pages, children, positions, seen):
+        """ children sorted by the leftmost leaf, subtrees without leaves skipped """
+        res = []
+        for number in numbers:
+            if number in seen:
+                continue
+            seen.add(number)
+            if pages[number][1].is_leaf:
+                res.append((positions[number], None))
+            else:
+                node = self._node(children.get(number, ()), pages, children, positions, seen)
+                if node:
+                    res.append((node[0][0], node))
+        res.sort(key=lambda child: child[0])
+        return res
+
+
 xor_pad = (
     0x9C, 0xDF, 0x9B, 0xF3, 0xBE, 0x3A, 0x83, 0xD8,
     0xC9, 0xF5, 0x50, 0x98, 0x35, 0x4E, 0x7F, 0xBB,
@@ -111,15 +324,351 @@ xor_pad = (
     0x24, 0xED, 0x2B, 0xD9, 0x1C, 0x68, 0x90, 0x79
 )
 
+# xor_pad as the bytes.translate table
+xor_pad_table = bytes(bytearray(xor_pad))
+
+
+# x6 system dictionary table based xor decoding
+# each block xored with start key=0x7f
+# 1. dictionary_encoder_offset -> article_offset
+#    must by decoded befor decoder.read()
+# 2. annotation_offset -> dictionary_encoder_offset
+#    annotation decoded in the read_annotation
+# 3. each article encoded individully
+#    articles_offset + heading.reference -> articles_offset + heading.next-reference
+#
+# key for the byte is xor_pad[previous encoded byte], so the whole block decoded at once:
+#   plain[i] = data[i] ^ xor_pad[data[i - 1]]
+def xor_decode_x6(data, key=0x7f):
+    """ return decoded copy of the block, data not modified """
+    if len(data) == 0:
+        return b""
+    keys = bytes(bytearray((key,))) + bytes(data[:-1]).translate(xor_pad_table)
+    if hasattr(int, 'from_bytes'):
+        res = int.from_bytes(data, 'big') ^ int.from_bytes(keys, 'big')
+        return res.to_bytes(len(data), 'big')
+    # python 2
+    return bytes(bytearray(a ^ b for a, b in zip(bytearray(data), bytearray(keys))))
+
+
+def string_offsets(strings):
+    """ offsets of the strings in the joined string, len(strings) + 1 items """
+    res = array('L', [0])
+    pos = 0
+    for item in strings:
+        pos += len(item)
+        res.append(pos)
+    return res
+
+
+def utf16_bytes(text):
+    return text.encode('utf-16-le', 'surrogatepass')
+
+
+def units_bytes(units):
+    """ UTF-16LE bytes of the code units array('H') """
+    if sys.byteorder == 'big':
+        units = array('H', units)
+        units.byteswap()
+    if hasattr(units, 'tobytes'):
+        return units.tobytes()
+    # python 2
+    return units.tostring()
+
+
+def indent_units(units):
+    """ UTF-16LE bytes of the article code units with the DSL indentation: tab after each new line """
+    data = units_bytes(units)
+    # code units 0x0A00..0x0AFF give the matches not at the code unit start
+    if b'\n' not in data[1::2]:
+        return data.replace(b'\n\x00', b'\n\x00\t\x00')
+    return utf16_bytes(data.decode('utf-16-le', 'surrogatepass').replace('\n', '\n\t'))
+
+
+def make_heading(text, extensions, reference):
+    h = Heading()
+    h.text = text
+    h.extensions = list(extensions)
+    res = ArticleHeading()
+    res.headings.append(h)
+    res.reference = reference
+    return res
+
+
+class Cursor:
+    """
+    reading position over the shared dictionary: own BitStream and decoder bound to it,
+    buffer, decoder tables, headings cache and index shared with the LsdFile,
+    so the cursors in the threads or tasks decode without locks
+    """
+    def __init__(self, lsd, bstr, decoder):
+        self.lsd = lsd
+        self.header = lsd.header
+        self.bstr = bstr
+        self.decoder = decoder
+
+    @property
+    def profile(self):
+        """ decoder profile, None for the LsdFile.cursor() cursors """
+        return self.decoder.profile
+
+    def _stage(self, name):
+        if self.profile is None:
+            return profiler.NO_STAGE
+        return self.profile.stage(name)
+
+    @property
+    def xored(self):
+        return self.lsd.xored
+
+    @property
+    def pages_count(self):
+        return self.lsd.pages_count
+
+    def get_page_offset(self, page_number):
+        return self.lsd.get_page_offset(page_number)
+
+    @contextmanager
+    def decoded_block(self, start, end):
+        """
+        x6 system dictionary: bstr read decoded copy of the [start, end) block,
+        source record not modified
+        """
+        if not self.xored:
+            yield
+            return
+        record, base = self.bstr.record, self.bstr.base
+        with self._stage('xor'):
+            data = xor_decode_x6(record[start - base:end - base])
+        self.bstr.attach(data, start)
+        try:
+            yield
+        finally:
+            self.bstr.attach(record, base)
+
+    def read_page(self, page_number):
+        """ headings from the leaf page, empty list for the internal page """
+        start = self.get_page_offset(page_number)
+        self.bstr.seek(start)
+        page = CachePage(self.bstr)
+        res = []
+        if page.is_leaf:
+            prefix = ""
+            for idx in range(page.headings_count):
+                heading = ArticleHeading()
+                prefix = heading.read(self.decoder, self.bstr, prefix)
+                res.append(heading)
+        if self.profile is not None:
+            self.profile.count('bits', self.bstr.bit_pos - (start << 3))
+        return res
+
+    def read_first_heading(self, page_number):
+        """ first heading from the leaf page, None for the internal or empty page """
+        self.bstr.seek(self.get_page_offset(page_number))
+        page = CachePage(self.bstr)
+        if not page.is_leaf or page.headings_count == 0:
+            return None
+        heading = ArticleHeading()
+        heading.read(self.decoder, self.bstr, "")
+        return heading
+
+    def page_tree(self):
+        """ PageTree of the dictionary, read once for all the cursors """
+        lsd = self.lsd
+        if lsd._page_tree is None:
+            with lsd._lock:
+                if lsd._page_tree is None:
+                    lsd._page_tree = PageTree(self)
+        return lsd._page_tree
+
+    # Descended from the root by the first headings of the children leftmost leaves,
+    # headings compared as heading_key (str.lower, code points), Lingvo collation not known.
+    def find_leaf(self, key):
+        """ position in the PageTree.leaves of the first leaf may contain headings with the key """
+        tree = self.page_tree()
+        node = tree.root
+        res = 0
+        while node:
+            # last child with the first heading less than the key:
+            # previous leaf may end with the key
+            lo = 0
+            hi = len(node) - 1
+            child = 0
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                heading = self.read_first_heading(tree.leaves[node[mid][0]])
+                if heading is not None and heading_key(heading.get_first().text) < key:
+                    child = mid
+                    lo = mid + 1
+                else:
+                    hi = mid - 1
+            res, node = node[child]
+        return res
+
+    def find_page(self, key):
+        """ number of the first leaf page may contain headings with the key """
+        leaves = self.page_tree().leaves
+        return leaves[self.find_leaf(key)] if leaves else 0
+
+    def lookup(self, word):
+        """ [(heading, article), ..] for the word, see LsdFile.lookup """
+        key = heading_key(word)
+        lsd = self.lsd
+        headwords = lsd.open_index() if lsd.use_index else None
+        if headwords is not None:
+            found = lsd._index_headings(headwords.find(key))
+        elif lsd._cache is not None:
+            found = lsd._lookup_cache(key)
+        else:
+            found = self._search_pages(key, key.__eq__)
+        return [(h, self.read_article(h)) for h in found]
+
+    def prefix_search(self, prefix, limit=10):
+        """ headings started with the prefix, see LsdFile.prefix_search """
+        key = heading_key(prefix)
+        headwords = self.lsd.open_index() if self.lsd.use_index else None
+        if headwords is not None:
+            return self.lsd._index_headings(headwords.prefix(key, limit))
+        return self._search_pages(key, lambda h_key: h_key.startswith(key), limit)
+
+    def _search_pages(self, key, match, limit=None):
+        """
+        matched headings from the leaf pages, decoded from the leaf with the key
+        until the headings greater than the key and not matched or limit found.
+        Decoded headings not in the heading_key order (other collation) and nothing found:
+        all the pages scanned, the next searches scan all the pages too
+        """
+        lsd = self.lsd
+        if lsd.pages_sorted is not False:
+            found, in_order = self._scan_pages(self.find_leaf(key), key, match, limit)
+            if in_order:
+                return found
+            lsd.pages_sorted = False
+            if len(found) > 0:
+                return found
+        found, in_order = self._scan_pages(0, None, match, limit)
+        return found
+
+    def _scan_pages(self, start, key, match, limit):
+        """
+        matched headings from the start leaf in the dictionary order, until the heading
+        greater than the key (None - until the last leaf) or limit found,
+        return (headings, decoded headings in the heading_key order around the key)
+        """
+        leaves = self.page_tree().leaves
+        found = ArticleHeadingList()
+        # references of the all decoded headings, for the next_reference
+        references = []
+        count = 0
+        prev_key = None
+        # start leaf first heading less than the key, see find_leaf
+        in_order = True
+        done = False
+        pos = start
+        while pos < len(leaves) and not done:
+            for heading in self.read_page(leaves[pos]):
+                references.append(heading.reference)
+                h_key = heading_key(heading.get_first().text)
+                if prev_key is None:
+                    in_order = start == 0 or key is None or h_key < key
+                elif h_key < prev_key:
+                    in_order = False
+                prev_key = h_key
+                if match(h_key) and (limit is None or count < limit):
+                    found.append(heading)
+                    count += 1
+                elif key is not None and h_key > key:
+                    done = True
+            if limit is not None and count >= limit:
+                done = True
+            pos += 1
+        references.sort()
+        for h in found:
+            idx = bisect.bisect_right(references, h.reference)
+            # unknown for the last decoded article, see read_article
+            h.next_reference = references[idx] if idx < len(references) else None
+        return found, in_order
+
+    def read_article(self, heading):
+        return self._read_article(heading, self.decoder.decode_article)
+
+    def read_article_units(self, heading):
+        """ article as UTF-16 code units: array('H') """
+        return self._read_article(heading, self.decoder.decode_article_units)
+
+    def _read_article(self, heading, decode):
+        start = self.header.articles_offset + heading.reference
+        if heading.next_reference is not None:
+            end = self.header.articles_offset + heading.next_reference
+        else:
+            end = self.article_end_bound(start)
+        self.bstr.seek(start)
+        with self.decoded_block(start, end):
+            size = self.bstr.read_bits(16)
+            if size == 0xFFFF:
+                size = self.bstr.read_bits(32)
+
+            res = decode(size)
+            if self.profile is not None:
+                self.profile.count('bits', self.bstr.bit_pos - (start << 3))
+        # assert(res)
+        return res
+
+    def article_end_bound(self, start):
+        """ upper bound of the article end, when next article unknown """
+        if not self.xored:
+            return self.header.pages_offset
+        self.bstr.seek(start)
+        with self.decoded_block(start, start + 6):
+            size = self.bstr.read_bits(16)
+            if size == 0xFFFF:
+                size = self.bstr.read_bits(32)
+        # each symbol - longest code and longest prefix or back reference index
+        bits = self.decoder.max_article_symbol_bits(size)
+        return min(start + 6 + (size * bits + 7) // 8, self.header.pages_offset)
+
 
 class LsdFile:
-    def __init__(self, dict_file, verbose=False):
+    def __init__(self, dict_file, verbose=False, use_mmap=False, cache_dir=None, profile=None, use_index=False):
+        """
+        use_mmap - map dictionary file read only instead of reading it
+        into memory, only touched pages are loaded
+        cache_dir - directory for the decoded tables and headings cache
+        use_index - lookup by the headword index next to the dictionary written by build_index,
+        lookup by the pages if the index not exists or stale
+        profile - profiler.Profile for the stages time and decoding counters,
+        decoding in the worker processes (jobs > 1) not counted
+        """
         self.filename = dict_file
+        self.cache_dir = cache_dir
+        self._cache = None
+        self.use_index = use_index
+        self._index = None
+        self._index_opened = False
+        # PageTree, read on the first search
+        self._page_tree = None
+        # False - headings not in the heading_key order, pages search scan all the pages
+        self.pages_sorted = None
+        self._lock = threading.Lock()
+        self.pipeline_stats = None
+        self.profile = profile
         self._readed = False
+        self._headings_readed = False
         self._parsed = False
         self.verbose = verbose
+        self._mmap = None
+        with self._stage('header'):
+            self._read_header(dict_file, use_mmap)
+        self.decoder.profile = profile
+
+    def _read_header(self, dict_file, use_mmap):
         with open(dict_file, 'rb') as fp:
-            self.bstr = BitStream(bytearray(fp.read()))
+            if use_mmap:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                self._record = self._mmap
+            else:
+                self._record = bytearray(fp.read())
+        self.bstr = BitStream(self._record)
 
         self.overlay = None
         self.headings = ArticleHeadingList()
@@ -130,89 +679,83 @@ class LsdFile:
             raise LsdError('Allow only Lsd "LingVo" ident: %s' % repr(self.header.magic))
 
         # initialize decoder
+        decoder_class = get_decoder_class(self.header.version)
         self.decoder = None
-        hi_version = self.header.hi_version
-        version = self.header.version
-        if hi_version == 0x11:  # lingvo 11 dictionary: 0x11001
-            self.decoder = decoder.UserDictionaryDecoder(self.bstr)
-        elif hi_version == 0x12:  # lingvo 12 dictionary: 0x12001
-            self.decoder = decoder.UserDictionaryDecoder(self.bstr)
-        elif hi_version == 0x13:  # x3 dictionary: 0x131001 and 0x132001 if pages count > 1000
-            self.decoder = decoder.SystemDictionaryDecoder13(self.bstr)
-        elif hi_version == 0x14:  # x5 dictionary
-            if version == 0x142001:  # user dictionaries
-                self.decoder = decoder.UserDictionaryDecoder(self.bstr)
-            elif version == 0x141004:  # system dictionaries
-                self.decoder = decoder.SystemDictionaryDecoder14(self.bstr)
-            elif version == 0x145001:  # abbreviation dictionaries
-                self.decoder = decoder.AbbreviationDictionaryDecoder(self.bstr)
-        elif hi_version == 0x15:  # x6 dictionary
-            if version == 0x152001:  # user dictionaries
-                self.decoder = decoder.UserDictionaryDecoder(self.bstr)
-            elif version == 0x151005:  # system dictionaries
-                # xor dictionary
-                self.xor_block_x6(self.header.dictionary_encoder_offset, self.header.articles_offset)
-                self.decoder = decoder.SystemDictionaryDecoder14(self.bstr)
-            elif version == 0x155001:  # abbreviation dictionaries
-                self.decoder = decoder.AbbreviationDictionaryDecoder(self.bstr)
-
-        if self.decoder is None:
+        if decoder_class is None:
             self.dump()
             print("Not supported dictionary version: %s" % hex(self.header.version))
             exit(1)
             # raise LsdError("Not supported dict version %s" % hex(self.header.version))
+        self.decoder = decoder_class(self.bstr)
+        # reading with self.bstr, LsdFile.cursor() for the others
+        self._cursor = Cursor(self, self.bstr, self.decoder)
 
-        name_len = self.bstr.read_some(1)
-        self.name = self.bstr.read_unicode(name_len, False)
-        self.first_heading = self.bstr.read_unicode(self.bstr.read_byte(), False)
-        self.last_heading = self.bstr.read_unicode(self.bstr.read_byte(), False)
-        capitals_len = reverse32(self.bstr.read_int())
-        self.capitals = self.bstr.read_unicode(capitals_len, False)
-        # icon v12+
-        if self.header.version > 0x120000:
-            self.icon_size = reverse16(self.bstr.read_word())
-            self.icon = self.bstr.read(self.icon_size)
-        else:
-            self.icon_size = 0
-            self.icon = None
+        info = DictionaryInfo(self.bstr, self.header.version, self.bstr.length)
+        self.name = info.name
+        self.first_heading = info.first_heading
+        self.last_heading = info.last_heading
+        self.capitals = info.capitals
+        self.icon_size = info.icon_size
+        self.icon = info.icon
+        self.header_checksum = info.header_checksum
+        self.pages_end = info.pages_end
+        self.overlay_data = info.overlay_data
+        self.dummy1 = info.dummy1
+        self.dummy2 = info.dummy2
 
-        if self.header.version > 0x140000:
-            self.header_checksum = reverse32(self.bstr.read_int())
-        else:
-            self.header_checksum = 0
+        # set bstr pos for decoding
+        self.bstr.seek(self.header.dictionary_encoder_offset)
 
-        if self.header.version > 0x120000:
-            self.pages_end = reverse32(self.bstr.read_int())
-            self.overlay_data = reverse32(self.bstr.read_int())
-        else:
-            self.pages_end = self.bstr.length
-            self.overlay_data = self.bstr.length  # no overlay
+    def _stage(self, name):
+        """ profiled stage context """
+        if self.profile is None:
+            return profiler.NO_STAGE
+        return self.profile.stage(name)
 
-        if self.header.version > 0x140000:
-            self.dummy1 = reverse32(self.bstr.read_int())
-            self.dummy2 = reverse32(self.bstr.read_int())
-        else:
-            self.dummy1 = 0
-            self.dummy2 = 0
+    def _count(self, name, value):
+        if self.profile is not None:
+            self.profile.count(name, value)
 
-        # set bstr pos for decoding
-        self.bstr.seek(self.header.dictionary_encoder_offset)
+    def _count_file(self, filename):
+        if self.profile is not None:
+            self.profile.count('bytes_written', os.path.getsize(filename))
+
+    def _profiled(self, name, items):
+        """ items producing timed as the stage """
+        if self.profile is None:
+            return items
+        return self.profile.iterate(name, items)
+
+    def advise(self, option):
+        """
+        access pattern hint for the mapped file: 'sequential', 'random' or 'normal'
+        """
+        if self._mmap is None or not hasattr(self._mmap, 'madvise'):
+            return
+        flag = getattr(mmap, 'MADV_' + option.upper(), None)
+        if flag is not None:
+            self._mmap.madvise(flag)
 
-    # x6 system dictionary table based xor decoding
-    # each block xored with start key=0x7f
-    # 1. dictionary_encoder_offset -> article_offset
-    #    must by decoded befor decoder.read()
-    # 2. annotation_offset -> dictionary_encoder_offset
-    #    annotation decoded in the read_annotation
-    # 3. each article encoded individully
-    #    articles_offset + heading.reference -> articles_offset + heading.next-reference
-    #    article decoded in the
-    def xor_block_x6(self, start, end, key=0x7f):
-        for i in range(start, end):
-            byte = self.bstr.record[i]
-            self.bstr.record[i] = byte ^ key
-            key = xor_pad[byte]
-        return key
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def xored(self):
+        return self.header.version == 0x151005
+
+    def decoded_block(self, start, end):
+        return self._cursor.decoded_block(start, end)
 
     @property
     def pages_count(self):
@@ -221,9 +764,15 @@ class LsdFile:
     def get_page_offset(self, page_number):
         return self.header.pages_offset + 512 * page_number
 
-    def read_headings(self):
-        for i in range(self.pages_count):
-            self.read_heading_from_page(i)
+    def read_headings(self, jobs=1):
+        if jobs > 1:
+            # merged in the pages order, ArticleHeadingList join multititle articles
+            for headings in parallel.iter_pages(self, jobs):
+                for heading in headings:
+                    self.headings.append(heading)
+        else:
+            for i in range(self.pages_count):
+                self.read_heading_from_page(i)
         # set last next_reference
         self.headings[-1].next_reference = self.header.pages_offset - self.header.articles_offset
 
@@ -247,38 +796,201 @@ class LsdFile:
         return res
 
     def read_heading_from_page(self, page_number):
-        self.bstr.seek(self.get_page_offset(page_number))
-        page = CachePage(self.bstr)
-        if page.is_leaf:
-            prefix = ""
-            for idx in range(page.headings_count):
-                heading = ArticleHeading()
-                prefix = heading.read(self.decoder, self.bstr, prefix)
-                self.headings.append(heading)
+        for heading in self.read_page(page_number):
+            self.headings.append(heading)
 
-    def read_article(self, heading):
-        self.bstr.seek(self.header.articles_offset + heading.reference)
-        if self.header.version == 0x151005:
-            # xor article
-            self.xor_block_x6(self.header.articles_offset + heading.reference,
-                              self.header.articles_offset + heading.next_reference)
-        size = self.bstr.read_bits(16)
-        if size == 0xFFFF:
-            size = self.bstr.read_bits(32)
-
-        res = self.decoder.decode_article(size)
-        # assert(res)
+    def read_page(self, page_number):
+        """ headings from the leaf page, empty list for the internal page """
+        return self._cursor.read_page(page_number)
+
+    def read_first_heading(self, page_number):
+        return self._cursor.read_first_heading(page_number)
+
+    def find_page(self, key):
+        """ number of the first leaf page may contain headings with the key """
+        return self._cursor.find_page(key)
+
+    def lookup(self, word):
+        """
+        decode only the pages and the articles for the word,
+        return [(heading, article), ..] like the dict items,
+        word matched with the heading text, unsorted parts not matched, same with use_index
+        """
+        if not self.readed:
+            self.read()
+        return self._cursor.lookup(word)
+
+    def prefix_search(self, prefix, limit=10):
+        """
+        headings started with the prefix, case insensitive, first limit (None - all)
+        in the dictionary order, decoded only the pages from the prefix to the last match,
+        same headings read from the index with use_index,
+        return ArticleHeadingList with the references for the read_article
+        """
+        if not self.readed:
+            self.read()
+        return self._cursor.prefix_search(prefix, limit)
+
+    def _lookup_cache(self, key):
+        keys = self._cache['keys']
+        offsets = self._cache['key_offsets']
+        positions = self._cache['positions']
+        lo = 0
+        hi = len(positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[offsets[mid]:offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < len(positions) and keys[offsets[lo]:offsets[lo + 1]] == key:
+            found.append(positions[lo])
+            lo += 1
+        res = ArticleHeadingList()
+        for pos in sorted(found):
+            res.append(self._cached_heading(pos))
+        for h in res:
+            h.next_reference = self._cache['next_references'][self._cache['items'][h.reference]]
+        return res
+
+    @staticmethod
+    def _index_headings(entries):
+        """ ArticleHeadingList from the headword index entries """
+        res = ArticleHeadingList()
+        for text, extensions, reference, next_reference in entries:
+            h = make_heading(text, extensions, reference)
+            h.next_reference = next_reference
+            res.append(h)
         return res
 
+    def index_file(self):
+        return index.index_file(self.filename)
+
+    def build_index(self, path=None):
+        """ write headword index, headings decoded if not parsed yet """
+        if not self.headings_readed:
+            self.parse_headings()
+        path = index.write(path or self.index_file(), self.headings, self.header.checksum, self.bstr.length)
+        if self.verbose:
+            print('Write index:      %s' % path)
+        # opened again on the next lookup
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._index_opened = False
+        return path
+
+    def open_index(self):
+        """
+        mapped headword index, None if not exists or stale: lookup without the index,
+        index written only by build_index (lsdreader --index)
+        """
+        if not self._index_opened:
+            self._index_opened = True
+            self._index = index.load(self.index_file(), self.header.checksum, self.bstr.length)
+            if self._index is None and self.verbose:
+                print("Index not found or stale, lookup by the pages: %s" % self.index_file())
+        return self._index
+
+    def _cached_heading(self, pos):
+        texts = self._cache['texts']
+        offsets = self._cache['text_offsets']
+        return make_heading(texts[offsets[pos]:offsets[pos + 1]],
+                            self._cached_extensions(pos),
+                            self._cache['references'][pos])
+
+    def _cached_extensions(self, pos):
+        positions = self._cache['extension_positions']
+        idx = bisect.bisect_left(positions, pos)
+        if idx == len(positions) or positions[idx] != pos:
+            return ()
+        offsets = self._cache['extension_offsets']
+        return tuple(index.split_extensions(self._cache['extensions'][offsets[idx]:offsets[idx + 1]]))
+
+    def save_cache(self):
+        """ decoder tables and headings index, need parse_headings() befor call """
+        # headings in the merged order, string tables: joined strings and offsets
+        texts = []
+        references = array('L')
+        extensions = []
+        extension_positions = array('L')
+        item_references = array('L')
+        next_references = array('L')
+        for item in self.headings:
+            item_references.append(item.reference)
+            next_references.append(item.next_reference)
+            for h in item.headings:
+                if h.extensions:
+                    extension_positions.append(len(texts))
+                    extensions.append(index.join_extensions(h.extensions))
+                texts.append(h.text)
+                references.append(item.reference)
+        keys = sorted((heading_key(text), pos) for pos, text in enumerate(texts))
+        data = {
+            'decoder': self.decoder.get_state(),
+            'texts': "".join(texts),
+            'text_offsets': string_offsets(texts),
+            # unsorted parts of the headings by the text position
+            'extension_positions': extension_positions,
+            'extensions': "".join(extensions),
+            'extension_offsets': string_offsets(extensions),
+            'references': references,
+            # merged items references and their next_reference
+            'item_references': item_references,
+            'next_references': next_references,
+            'keys': "".join(k for k, pos in keys),
+            'key_offsets': string_offsets([k for k, pos in keys]),
+            'positions': array('L', [pos for k, pos in keys]),
+        }
+        path = cache.save(self.cache_dir, self.filename, self.header.checksum, data)
+        self._set_cache(data)
+        if self.verbose:
+            print('Write cache:      %s' % path)
+
+    def _set_cache(self, data):
+        """ cached data with the merged item by the reference """
+        data['items'] = dict((ref, idx) for idx, ref in enumerate(data['item_references']))
+        self._cache = data
+
+    def restore_headings(self):
+        """ headings from the cache, merged in the same order as read_headings """
+        for pos in range(len(self._cache['references'])):
+            self.headings.append(self._cached_heading(pos))
+        if len(self.headings) > 0:
+            self.headings[-1].next_reference = self.header.pages_offset - self.header.articles_offset
+
+    def read_article(self, heading):
+        return self._cursor.read_article(heading)
+
+    def read_article_units(self, heading):
+        """ article as UTF-16 code units: array('H') """
+        return self._cursor.read_article_units(heading)
+
+    def article_end_bound(self, start):
+        return self._cursor.article_end_bound(start)
+
+    def cursor(self):
+        """
+        new Cursor for the concurrent lookup, prefix_search and read_article,
+        decoder tables read and index opened once on the first call
+        """
+        with self._lock:
+            if not self.readed:
+                self.read()
+            if self.use_index:
+                self.open_index()
+        bstr = BitStream(self._record)
+        return Cursor(self, bstr, self.decoder.bind(bstr))
+
     def read_annotation(self):
-        if self.header.version == 0x151005:
-            # xor annotation
-            self.xor_block_x6(self.header.annotation_offset,
-                              self.header.dictionary_encoder_offset)
         res = ""
-        if self.bstr.seek(self.header.annotation_offset):
-            size = self.bstr.read_bits(16)
-            res = self.decoder.decode_article(size)
+        with self._stage('annotation'):
+            with self.decoded_block(self.header.annotation_offset, self.header.dictionary_encoder_offset):
+                if self.bstr.seek(self.header.annotation_offset):
+                    size = self.bstr.read_bits(16)
+                    res = self.decoder.decode_article(size)
+                    self._count('bits', self.bstr.bit_pos - (self.header.annotation_offset << 3))
         return res
 
     @property
@@ -286,49 +998,108 @@ class LsdFile:
         return self._readed
 
     def read(self):
-        if self.verbose:
-            print("reading dictionary..")
-        self.decoder.read()
+        with self._stage('decoder'):
+            self._read_decoder()
         self._readed = True
 
+    def _read_decoder(self):
+        if self.cache_dir is not None:
+            data = cache.load(self.cache_dir, self.filename, self.header.checksum)
+            if data is not None:
+                if self.verbose:
+                    print("reading dictionary from cache..")
+                try:
+                    self._set_cache(data)
+                    self.decoder.set_state(data['decoder'])
+                except Exception:
+                    # not the cache of this version, decoded again and rewritten
+                    self._cache = None
+        if self._cache is None:
+            if self.verbose:
+                print("reading dictionary..")
+            self.bstr.seek(self.header.dictionary_encoder_offset)
+            with self.decoded_block(self.header.dictionary_encoder_offset, self.header.articles_offset):
+                self.decoder.read()
+                self._count('bits', self.bstr.bit_pos - (self.header.dictionary_encoder_offset << 3))
+
     @property
-    def parsed(self):
-        return self._parsed
+    def headings_readed(self):
+        return self._headings_readed
 
-    def parse(self):
+    def parse_headings(self, jobs=1):
+        """
+        decoder, overlay and headings, articles not decoded
+        jobs - worker processes count for the pages decoding
+        """
         if not self.readed:
             self.read()
-        if self.verbose:
-            print("decoding overlay..")
-        self.overlay = OverlayReader(self.bstr, self.overlay_data)
+        with self._stage('headings'):
+            # full decoding read pages and articles in the file order
+            self.advise('sequential')
+            if self.verbose:
+                print("decoding overlay..")
+            self.overlay = OverlayReader(self.bstr, self.overlay_data)
 
-        if self.verbose:
-            print("decoding headings: %d" % self.header.entries_count)
-        self.read_headings()
-        if self.headings.appended != self.header.entries_count:
-            raise LsdError("Decoded not all entries %d != %d" % (self.headings.appended, self.header.entries_count))
+            if self._cache is not None:
+                self.restore_headings()
+            else:
+                if self.verbose:
+                    print("decoding headings: %d" % self.header.entries_count)
+                self.read_headings(jobs)
+            if self.headings.appended != self.header.entries_count:
+                raise LsdError("Decoded not all entries %d != %d" % (self.headings.appended, self.header.entries_count))
+            if self.cache_dir is not None and self._cache is None:
+                self.save_cache()
         # merge multititle headings
         # self.headings = self.merge_headings()
+        self._headings_readed = True
+
+    def iter_articles(self, jobs=1):
+        """
+        decode articles one by one: (heading, article)
+        jobs - worker processes count, articles decoded in chunks and returned in the headings order
+        """
+        if not self.headings_readed:
+            self.parse_headings()
+        if jobs > 1:
+            items = parallel.iter_articles(self, jobs)
+        else:
+            items = ((h, self.read_article(h)) for h in self.headings)
+        for item in self._profiled('articles', items):
+            yield item
+
+    @property
+    def parsed(self):
+        return self._parsed
+
+    def parse(self, jobs=1):
+        if not self.headings_readed:
+            self.parse_headings(jobs)
 
         if self.verbose:
             print("decoding articles: %d" % len(self.headings))
-        for h in self.headings:
-            # h.dump()
-            self.dict.append((h, self.read_article(h)))
+        for item in self.iter_articles(jobs):
+            # item[0].dump()
+            self.dict.append(item)
         self._parsed = True
         if self.verbose:
             print("OK")
 
-    def write(self, path=""):
-        """ save decoded dictionary """
-        if not self.parsed:
-            self.parse()
-        self.write_icon(path)
-        self.write_annotation(path)
-        self.write_overlay(path)
-        self.write_dsl(path)
-        if self.verbose:
-            self.write_prefix(path)
+    def write(self, path="", jobs=1, queue_depth=0, compress=None):
+        """
+        save decoded dictionary, articles decoded and written one by one
+        if dictionary not parsed
+        queue_depth, compress - pipelined and compressed dsl writing, see write_dsl
+        """
+        with self._stage('write'):
+            if not self.headings_readed:
+                self.parse_headings(jobs)
+            self.write_icon(path)
+            self.write_annotation(path)
+            self.write_overlay(path)
+            self.write_dsl(path, jobs, queue_depth, compress)
+            if self.verbose:
+                self.write_prefix(path)
 
     def make_filename(self, path, ext):
         base, orig_ext = os.path.splitext(self.filename)
@@ -342,6 +1113,7 @@ class LsdFile:
         ico_file = self.make_filename(path, "bmp")
         with open(ico_file, 'wb') as ico:
             ico.write(self.icon)
+        self._count_file(ico_file)
         if self.verbose:
             print('Write icon:       %s' % ico_file)
 
@@ -352,6 +1124,7 @@ class LsdFile:
         ann_file = self.make_filename(path, "ann")
         with codecs.open(ann_file, 'w', encoding='utf-16', errors='surrogatepass') as ann:
             ann.write(annotation)
+        self._count_file(ann_file)
         if self.verbose:
             print('Write annotation: %s' % ann_file)
 
@@ -361,6 +1134,7 @@ class LsdFile:
         pref_file = self.make_filename(path, "pref")
         with codecs.open(pref_file, 'w', encoding='utf-8') as pref:
             pref.write(self.decoder.prefix)
+        self._count_file(pref_file)
         if self.verbose:
             print('Write prefix:     %s' % pref_file)
 
@@ -372,32 +1146,73 @@ class LsdFile:
         res = article.replace(u'\n', u'\n\t')
         return res
 
-    def write_dsl(self, path=""):
-        if len(self.dict) == 0:
+    def write_dsl(self, path="", jobs=1, queue_depth=0, compress=None):
+        """
+        queue_depth - if not zero, entries encoded and written in the writer thread
+        while next articles decoded, pipeline_stats has the stalls
+        compress - compress.GZIP or compress.DICTZIP, written .dsl.gz or .dsl.dz,
+        compressed in the writer thread
+        """
+        if self.parsed:
+            items = self.dict
+        else:
+            if not self.headings_readed:
+                self.parse_headings(jobs)
+            if jobs > 1:
+                items = self.iter_articles(jobs)
+            else:
+                # articles decoded to the UTF-16 code units
+                items = self._profiled('articles', ((h, self.read_article_units(h)) for h in self.headings))
+        if len(self.headings) == 0:
             print("Nothing writing to dsl!")
             return
         dsl_file = self.make_filename(path, "dsl")
-        with codecs.open(dsl_file, 'w', encoding='utf-16', errors='surrogatepass') as dsl:
-            dsl.write(u"#NAME\t\"" + self.name + u"\"\n")
-            dsl.write(u"#INDEX_LANGUAGE\t\"" + tools.lang_map[self.header.source_language] + u"\"\n")
-            dsl.write(u"#CONTENTS_LANGUAGE\t\"" + tools.lang_map[self.header.target_language] + u"\"\n")
+        if compress is not None:
+            dsl_file += '.' + compress
+            if queue_depth == 0:
+                queue_depth = pipeline.QUEUE_DEPTH
+        with compress_output(dsl_file, compress) as dsl:
+            dsl.write(codecs.BOM_UTF16_LE)
+            dsl.write(utf16_bytes(u"#NAME\t\"" + self.name + u"\"\n"))
+            dsl.write(utf16_bytes(u"#INDEX_LANGUAGE\t\"" + tools.lang_map[self.header.source_language] + u"\"\n"))
+            dsl.write(utf16_bytes(u"#CONTENTS_LANGUAGE\t\"" + tools.lang_map[self.header.target_language] + u"\"\n"))
             if self.icon_size > 0:
                 base, orig_ext = os.path.splitext(os.path.basename(self.filename))
-                dsl.write(u"#ICON_FILE\t\"" + base + '.' + "bmp" + u"\"\n")
-            dsl.write(u"\n")
-            for h, r in self.dict:
-                if h.simple:
-                    dsl.write(h.get_first_ext_text())
-                    dsl.write(u"\n\t")
-                else:
-                    for item in h.headings:
-                        dsl.write(item.ext_text)
-                        dsl.write(u"\n")
-                    dsl.write(u"\t")
-                dsl.write(self.normalize_article(r))
-                dsl.write(u"\n")
+                dsl.write(utf16_bytes(u"#ICON_FILE\t\"" + base + '.' + "bmp" + u"\"\n"))
+            dsl.write(utf16_bytes(u"\n"))
+            if queue_depth > 0:
+                writer = pipeline.PipelineWriter(dsl, self.dsl_entry, queue_depth)
+                self.pipeline_stats = writer.stats
+                writer.start()
+                try:
+                    for item in items:
+                        writer.put(item)
+                except BaseException:
+                    writer.abort()
+                    raise
+                writer.close()
+            else:
+                for item in items:
+                    dsl.write(self.dsl_entry(item))
+        self._count_file(dsl_file)
         if self.verbose:
             print('Write dsl:        %s' % dsl_file)
+            if self.pipeline_stats is not None:
+                self.pipeline_stats.dump()
+
+    def dsl_entry(self, item):
+        """ (heading, article) UTF-16LE bytes, article - str or code units array """
+        h, r = item
+        if h.simple:
+            res = [utf16_bytes(h.get_first_ext_text() + u"\n\t")]
+        else:
+            res = [utf16_bytes(u"".join(heading.ext_text + u"\n" for heading in h.headings) + u"\t")]
+        if isinstance(r, array):
+            res.append(indent_units(r))
+        else:
+            res.append(utf16_bytes(self.normalize_article(r)))
+        res.append(utf16_bytes(u"\n"))
+        return b"".join(res)
 
     def dump(self):
         self.header.dump()
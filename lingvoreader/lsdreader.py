@@ -4,6 +4,8 @@ from __future__ import (division, absolute_import, print_function, with_statemen
 
 import argparse
 import codecs
+import json
+import multiprocessing
 import os
 import sys
 from timeit import default_timer as timer
@@ -11,7 +13,10 @@ from timeit import default_timer as timer
 from lingvoreader import __version__
 from lingvoreader import LsdError
 from lingvoreader import tools
-from lingvoreader.lsdfile import LsdFile
+from lingvoreader import compress
+from lingvoreader import bench
+from lingvoreader.profiler import Profile
+from lingvoreader.lsdfile import LsdFile, Probe
 
 __author__ = 'sv99'
 
@@ -35,7 +40,14 @@ if sys.platform.startswith("win") and (sys.version_info < (3, 0)):
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout)
 
 
-def unpack(dicts, dest_dir, verbose):
+def profile_json(m, profile):
+    """ json line: dictionary, version and profile stages and counters """
+    res = {"file": m.filename, "version": hex(m.header.version)}
+    res.update(profile.as_dict())
+    return json.dumps(res)
+
+
+def unpack(dicts, dest_dir, verbose, use_mmap=False, jobs=1, queue_depth=0, compress=None, profile=False):
     # dict_ext = os.path.splitext(dict_file)[1].upper()
     # if dict_ext != '.LSD':
     #     raise LsdError("Need Lingvo lsd dictionary.")
@@ -49,10 +61,15 @@ def unpack(dicts, dest_dir, verbose):
         try:
             if count > 1:
                 print("Unpacking dict (%d from %d): %s" % (i + 1, count, dict_file))
-            m = LsdFile(dict_file, verbose)
-            m.parse()
+            p = Profile() if profile else None
+            m = LsdFile(dict_file, verbose, use_mmap, profile=p)
+            # articles decoded while writing
+            m.parse_headings(jobs)
             m.dump()
-            m.write(dest_dir)
+            m.write(dest_dir, jobs, queue_depth, compress)
+            m.close()
+            if p is not None:
+                print(profile_json(m, p))
         except ValueError as e:
             print("Error: %s" % e)
             return 1
@@ -62,7 +79,56 @@ def unpack(dicts, dest_dir, verbose):
     return 0
 
 
-def header(dicts):
+def _convert(task):
+    """ batch worker: (dict_file, ok, elapsed, size, error, profile json or None) """
+    dict_file, dest_dir, use_mmap, compress, profile = task
+    start = timer()
+    p = Profile() if profile else None
+    try:
+        m = LsdFile(dict_file, False, use_mmap, profile=p)
+        m.parse_headings()
+        m.write(dest_dir, compress=compress)
+        m.close()
+    except (Exception, SystemExit) as e:
+        # LsdFile exit() for not supported version
+        return dict_file, False, timer() - start, 0, str(e) or e.__class__.__name__, None
+    return dict_file, True, timer() - start, os.path.getsize(dict_file), "", profile_json(m, p) if p is not None else None
+
+
+def batch(dicts, dest_dir, parallel, use_mmap=False, compress=None, profile=False):
+    """
+    convert dictionaries in the parallel worker processes,
+    failed dictionaries reported and not stopped the rest
+    """
+    count = len(dicts)
+    print("Unpacking %d dicts, %d at once" % (count, parallel))
+    start = timer()
+    failed = 0
+    total_size = 0
+    pool = multiprocessing.Pool(parallel)
+    try:
+        tasks = [(dict_file, dest_dir, use_mmap, compress, profile) for dict_file in dicts]
+        for i, (dict_file, ok, elapsed, size, error, stats) in enumerate(pool.imap_unordered(_convert, tasks)):
+            if ok:
+                total_size += size
+                print("(%d from %d) %s: OK (%s)" % (i + 1, count, dict_file, tools.display_time(elapsed)))
+                if stats is not None:
+                    print(stats)
+            else:
+                failed += 1
+                print("(%d from %d) %s: Error: %s" % (i + 1, count, dict_file, error))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    elapsed = timer() - start
+    mb = total_size / (1024 * 1024)
+    print("Unpacked %d from %d, failed %d: %.1f MB in %s (%.2f MB/s)" %
+          (count - failed, count, failed, mb, tools.display_time(elapsed), mb / elapsed if elapsed else 0))
+    return 1 if failed else 0
+
+
+def header(dicts, use_mmap=False):
     # dict_ext = os.path.splitext(dict_file)[1].upper()
     # if dict_ext != '.LSD':
     #     raise LsdError("Need Lingvo lsd dictionary.")
@@ -75,8 +141,9 @@ def header(dicts):
         try:
             if count > 1:
                 print("Unpacking dict (%d from %d): %s" % (i + 1, count, dict_file))
-            m = LsdFile(dict_file, True)
+            m = LsdFile(dict_file, True, use_mmap)
             m.dump()
+            m.close()
             # print("Header %s OK" % dict_file)
         except ValueError as e:
             print("Error: %s" % e)
@@ -85,6 +152,43 @@ def header(dicts):
     return 0
 
 
+def probe(dicts, as_json=False):
+    """ header only from the first bytes of the file, json line for each dictionary """
+    failed = 0
+    for dict_file in dicts:
+        try:
+            m = Probe(dict_file)
+        except (LsdError, IOError, OSError, ValueError) as e:
+            failed += 1
+            if as_json:
+                print(json.dumps({"file": dict_file, "error": str(e)}))
+            else:
+                print("%s: Error: %s" % (dict_file, e))
+            continue
+        if as_json:
+            print(json.dumps(m.as_dict(), ensure_ascii=False))
+        else:
+            print("Dict: %s" % dict_file)
+            m.dump()
+    return 1 if failed else 0
+
+
+def build_index(dicts, verbose=False, use_mmap=False):
+    """ headword index next to each dictionary, for the lookup without the pages decoding """
+    failed = 0
+    for dict_file in dicts:
+        start = timer()
+        try:
+            with LsdFile(dict_file, verbose, use_mmap) as m:
+                path = m.build_index()
+        except (LsdError, IOError, OSError, ValueError) as e:
+            failed += 1
+            print("%s: Error: %s" % (dict_file, e))
+            continue
+        print("%s: %s (%s)" % (dict_file, path, tools.display_time(timer() - start)))
+    return 1 if failed else 0
+
+
 def get_dicts():
     current = os.getcwd()
     res = []
@@ -112,12 +216,29 @@ class CodecsAction(argparse.Action):
 
 
 def get_arg_parser():
-    p = argparse.ArgumentParser(description='Decode Lingvo lsd dictionary to dsl')
+    p = argparse.ArgumentParser(description='Decode Lingvo lsd dictionary to dsl',
+                                epilog='lsdreader bench -h - decoding benchmarks')
     g = p.add_mutually_exclusive_group(required=True)
     g.add_argument("-i", "--input", help='Dictionary to decode')
     g.add_argument("-a", "--all", action="store_true", help='All dictionary in current directory')
     p.add_argument("--header", action="store_true", default=False, help='Print dictionary header and exit')
+    p.add_argument("--probe", action="store_true", default=False,
+                   help='Print dictionary header read from the start of the file, without decoding')
+    p.add_argument("--json", action="store_true", default=False, help='Probe output as json line per dictionary')
+    p.add_argument("--index", action="store_true", default=False,
+                   help='Write headword index next to the dictionary for the fast lookup and exit')
     p.add_argument("-o", "--outdir", default="", help="Output directory")
+    p.add_argument("--mmap", action="store_true", default=False,
+                   help="Map dictionary file into memory instead of reading it")
+    p.add_argument("-j", "--jobs", type=int, default=1, help="Worker processes for the headings and articles decoding")
+    p.add_argument("-p", "--parallel", type=int, default=1,
+                   help="Dictionaries converted at once with -a, each in the single process")
+    p.add_argument("-q", "--queue-depth", type=int, default=0,
+                   help="Write dsl in the separate thread, entries queued while writing")
+    p.add_argument("-z", "--compress", choices=compress.FORMATS,
+                   help="Write compressed dsl: gz - gzip, dz - dictzip with random access")
+    p.add_argument("--profile", action="store_true", default=False,
+                   help="Print stages time and decoding counters as json line per dictionary")
     p.add_argument("-c", "--codecs", action=CodecsAction)
     p.add_argument("-v", "--verbose", action="store_true", default=False)
     p.add_argument('--version', action='version', version='%(prog)s ' + __version__)
@@ -125,26 +246,37 @@ def get_arg_parser():
 
 
 def main():
+    if sys.argv[1:2] == ['bench']:
+        return bench.main(sys.argv[2:])
     args = get_arg_parser().parse_args()
     dicts = []
     if args.all:
         # all lsd in directory
-        print("Decode all lsd in current directory..")
         dicts = get_dicts()
-        print(dicts)
+        if not args.json:
+            print("Decode all lsd in current directory..")
+            print(dicts)
     else:
         dicts.append(args.input)
 
+    if args.probe:
+        return probe(dicts, args.json)
+    if args.index:
+        return build_index(dicts, args.verbose, args.mmap)
     if args.header:
-        header(dicts)
+        header(dicts, args.mmap)
     else:
         if args.outdir != "":
             # check path
             if not os.path.exists(args.outdir):
                 os.mkdir(args.outdir)
 
+        if args.parallel > 1 and len(dicts) > 1:
+            return batch(dicts, args.outdir, args.parallel, args.mmap, args.compress, args.profile)
+
         start = timer()
-        unpack(dicts, args.outdir, args.verbose)
+        unpack(dicts, args.outdir, args.verbose, args.mmap, args.jobs, args.queue_depth, args.compress,
+               args.profile)
         end = timer()
         if len(dicts) > 1:
             # print("Files count: %i" % c)
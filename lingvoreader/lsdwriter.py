@@ -0,0 +1,738 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import argparse
+import binascii
+import codecs
+import heapq
+import random
+import struct
+import sys
+import zlib
+
+from lingvoreader import __version__
+from lingvoreader import LsdError
+from lingvoreader import tools
+from lingvoreader.articleheading import heading_key
+from lingvoreader.lsdfile import xor_pad
+
+__author__ = 'sv99'
+
+
+# synthetic lsd encoder, reverse of the LsdFile
+#
+# layout: header, name/headings/capitals/icon, annotation, decoder tables,
+# articles, leaf pages, B-tree internal pages (with fanout). Overlay is not written.
+# Internal pages written with the header only: children by the parent links,
+# the separators format is not known, the reader not decodes them.
+
+USER_VERSIONS = (0x142001, 0x152001)
+SYSTEM_VERSIONS = (0x131001, 0x141004, 0x151005)
+ABBREVIATION_VERSIONS = (0x145001, 0x155001)
+SUPPORTED_VERSIONS = USER_VERSIONS + SYSTEM_VERSIONS + ABBREVIATION_VERSIONS
+
+PAGE_SIZE = 512
+# 1 bit is_leaf + 5 * 16 bits, aligned to the byte
+PAGE_HEADER_BITS = 88
+# BitWriter accumulator bits converted to the bytes at once
+_FLUSH_BITS = 1024
+
+
+class BitWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self._acc = 0
+        self._nbits = 0
+
+    @property
+    def bit_length(self):
+        return len(self.data) * 8 + self._nbits
+
+    def write_bits(self, value, count):
+        self._acc = (self._acc << count) | (value & ((1 << count) - 1))
+        self._nbits += count
+        if self._nbits >= _FLUSH_BITS:
+            self._flush()
+
+    def _flush(self):
+        """ whole bytes of the accumulator to the data """
+        size = self._nbits >> 3
+        if size == 0:
+            return
+        rest = self._nbits & 7
+        self.data.extend(binascii.unhexlify('%0*x' % (size * 2, self._acc >> rest)))
+        self._acc &= (1 << rest) - 1
+        self._nbits = rest
+
+    def write_pieces(self, pieces):
+        for value, count in pieces:
+            self.write_bits(value, count)
+
+    def align(self):
+        """ pad to the byte, data has all written bits """
+        if self._nbits & 7:
+            self.write_bits(0, 8 - (self._nbits & 7))
+        self._flush()
+
+    def write_bytes(self, data):
+        self.align()
+        self.data.extend(data)
+
+    def write_byte(self, value):
+        self.write_bytes(struct.pack('>B', value))
+
+    def write_word(self, value):
+        self.write_bytes(struct.pack('>H', value))
+
+    def write_int(self, value):
+        self.write_bytes(struct.pack('>L', value))
+
+    def write_unicode(self, text, big_endian=True):
+        self.write_bytes(text.encode('utf-16-be' if big_endian else 'utf-16-le', 'surrogatepass'))
+
+    def getvalue(self):
+        self.align()
+        return bytes(self.data)
+
+
+def huffman_lengths(weights):
+    """ weights - {symbol index: weight}, return {symbol index: code length} """
+    if len(weights) == 1:
+        sym, = weights
+        return {sym: 1}
+    heap = [(w, i, (sym,)) for i, (sym, w) in enumerate(sorted(weights.items()))]
+    heapq.heapify(heap)
+    lengths = dict((sym, 0) for sym in weights)
+    counter = len(heap)
+    while len(heap) > 1:
+        w1, _, s1 = heapq.heappop(heap)
+        w2, _, s2 = heapq.heappop(heap)
+        for sym in s1 + s2:
+            lengths[sym] += 1
+        heapq.heappush(heap, (w1 + w2, counter, s1 + s2))
+        counter += 1
+    return lengths
+
+
+class LenTableWriter:
+    """
+    canonical huffman code for LenTable, written sorted by code length,
+    so LenTable.assign_codes gives the same codes
+    """
+    def __init__(self, weights):
+        # LenTable need at least two symbols
+        weights = dict(weights)
+        if len(weights) < 2:
+            weights[len(weights)] = 0
+        self.count = len(weights)
+        assert sorted(weights) == list(range(self.count))
+        self.lengths = huffman_lengths(weights)
+        self.codes = {}
+        code = 0
+        prev_len = 0
+        self.entries = sorted(self.lengths.items(), key=lambda item: (item[1], item[0]))
+        for sym, length in self.entries:
+            code <<= length - prev_len
+            self.codes[sym] = (code, length)
+            code += 1
+            prev_len = length
+
+    def write(self, bw):
+        bits_per_len = tools.bit_length(max(self.lengths.values()))
+        idx_bit_size = tools.bit_length(self.count)
+        bw.write_bits(self.count, 32)
+        bw.write_bits(bits_per_len, 8)
+        for sym, length in self.entries:
+            bw.write_bits(sym, idx_bit_size)
+            bw.write_bits(length, bits_per_len)
+
+    def encode(self, sym):
+        return self.codes[sym]
+
+
+def write_symbols(bw, symbols, xor=0):
+    bits_per_symbol = tools.bit_length(max(s ^ xor for s in symbols))
+    bw.write_bits(len(symbols), 32)
+    bw.write_bits(bits_per_symbol, 8)
+    for s in symbols:
+        bw.write_bits(s ^ xor, bits_per_symbol)
+
+
+class ArticleCoder:
+    """ lz-like article coding with the prefix and back-references """
+    MIN_MATCH = 3
+
+    def __init__(self, version, prefix):
+        self.system = version in SYSTEM_VERSIONS
+        self.prefix = prefix
+        self.max_prefix_match = 66
+        self.max_back_match = 67 if self.system else 66
+        self._prefix_index = self._make_index(prefix)
+
+    @classmethod
+    def _make_index(cls, text):
+        index = {}
+        for i in range(len(text) - cls.MIN_MATCH + 1):
+            index.setdefault(text[i:i + cls.MIN_MATCH], []).append(i)
+        return index
+
+    def tokens(self, text):
+        """ ('l', char), ('p', start, length) or ('b', start, length) """
+        res = []
+        index = {}
+        prefix = self.prefix
+        prefix_index = self._prefix_index
+        min_match = self.MIN_MATCH
+        prefix_size = len(prefix)
+        pos = 0
+        size = len(text)
+        while pos < size:
+            best = None
+            # longer match only, candidates with other char at the best length skipped
+            best_len = min_match - 1
+            key = text[pos:pos + min_match]
+            if len(key) == min_match:
+                rest = size - pos
+                prefix_limit = self.max_prefix_match if rest > self.max_prefix_match else rest
+                back_limit = self.max_back_match if rest > self.max_back_match else rest
+                for start in prefix_index.get(key, ())[:8]:
+                    limit = prefix_size - start
+                    if limit > prefix_limit:
+                        limit = prefix_limit
+                    if limit <= best_len or prefix[start + best_len] != text[pos + best_len]:
+                        continue
+                    length = min_match
+                    while length < limit and prefix[start + length] == text[pos + length]:
+                        length += 1
+                    if length > best_len:
+                        best = ('p', start, length)
+                        best_len = length
+                for start in index.get(key, ())[-8:]:
+                    # copy must be inside already decoded text
+                    limit = pos - start
+                    if limit > back_limit:
+                        limit = back_limit
+                    if limit <= best_len or text[start + best_len] != text[pos + best_len]:
+                        continue
+                    length = min_match
+                    while length < limit and text[start + length] == text[pos + length]:
+                        length += 1
+                    if length > best_len:
+                        best = ('b', start, length)
+                        best_len = length
+            if best is not None:
+                step = best_len
+                res.append(best)
+            else:
+                step = 1
+                res.append(('l', text[pos]))
+            for i in range(pos, min(pos + step, size - min_match + 1)):
+                index.setdefault(text[i:i + min_match], []).append(i)
+            pos += step
+        return res
+
+    def symbol(self, token):
+        kind = token[0]
+        if self.system:
+            if kind == 'l':
+                return ord(token[1]) + 0x80
+            if kind == 'p':
+                return token[2] - 3
+            return token[2] + 0x3d
+        if kind == 'l':
+            return ord(token[1])
+        if kind == 'p':
+            return token[2] + 0xfffd
+        return token[2] + 0x1003d
+
+
+def parse_heading(ext_text):
+    """ dsl heading with {unsorted} parts and \\ escapes -> (text, [(idx, char)]) """
+    text = ""
+    unsorted = []
+    full_idx = 0
+    in_braces = False
+    escaped = False
+    for ch in ext_text:
+        if escaped:
+            escaped = False
+            if in_braces:
+                unsorted.append((full_idx, ch))
+            else:
+                text += ch
+            full_idx += 1
+        elif ch == '\\':
+            escaped = True
+            unsorted.append((full_idx, ch))
+            full_idx += 1
+        elif ch == '{' and not in_braces:
+            in_braces = True
+        elif ch == '}' and in_braces:
+            in_braces = False
+        elif in_braces:
+            unsorted.append((full_idx, ch))
+            full_idx += 1
+        else:
+            text += ch
+            full_idx += 1
+    return text, unsorted
+
+
+class LsdWriter:
+    def __init__(self, version=0x142001, name="", source_language=1033, target_language=1049,
+                 annotation="", icon=None, prefix=None, sort_key=None, fanout=None):
+        """
+        sort_key - headings order, heading_key by default
+        fanout - children of the B-tree internal page, None - leaf pages only
+        """
+        if version not in SUPPORTED_VERSIONS:
+            raise LsdError("Not supported dictionary version: %s" % hex(version))
+        self.version = version
+        self.name = name
+        self.source_language = source_language
+        self.target_language = target_language
+        self.annotation = annotation
+        self.icon = icon
+        self.prefix = prefix
+        self.sort_key = sort_key or heading_key
+        self.fanout = fanout
+        # [([ext heading, ...], article), ...]
+        self.entries = []
+
+    def add(self, headings, article):
+        if not isinstance(headings, (list, tuple)):
+            headings = [headings]
+        self.entries.append((list(headings), article))
+
+    @staticmethod
+    def make_prefix(articles, size=2048):
+        """ most frequent words as the shared prefix dictionary """
+        counts = {}
+        for article in articles:
+            for word in article.split():
+                if len(word) >= 4:
+                    counts[word] = counts.get(word, 0) + 1
+        res = ""
+        for word in sorted(counts, key=lambda w: (-counts[w] * len(w), w)):
+            if counts[word] < 2 or len(res) + len(word) + 1 > size:
+                break
+            res += word + " "
+        return res
+
+    @property
+    def is_system(self):
+        return self.version in SYSTEM_VERSIONS
+
+    @property
+    def is_abbreviation(self):
+        return self.version in ABBREVIATION_VERSIONS
+
+    @property
+    def is_x6_system(self):
+        return self.version == 0x151005
+
+    def _headings(self):
+        res = []
+        for number, (headings, article) in enumerate(self.entries):
+            for ext_text in headings:
+                text, unsorted = parse_heading(ext_text)
+                # same order for the headings equal by the key
+                res.append(((self.sort_key(text), text), number, text, unsorted))
+        res.sort()
+        return res
+
+    def build(self):
+        if len(self.entries) == 0:
+            raise LsdError("Nothing to write")
+        headings = self._headings()
+        articles = [article for h, article in self.entries]
+        prefix = self.prefix
+        if prefix is None:
+            prefix = self.make_prefix(articles)
+        coder = ArticleCoder(self.version, prefix)
+
+        # article order follows first heading order
+        order = []
+        seen = set()
+        for key, number, text, unsorted in headings:
+            if number not in seen:
+                seen.add(number)
+                order.append(number)
+
+        # article symbols
+        tokens = {}
+        for number in order:
+            tokens[number] = coder.tokens(articles[number])
+        annotation_tokens = coder.tokens(self.annotation) if self.annotation else []
+        sym_weights = {}
+        for token_list in list(tokens.values()) + [annotation_tokens]:
+            for t in token_list:
+                sym = coder.symbol(t)
+                sym_weights[sym] = sym_weights.get(sym, 0) + 1
+        if len(sym_weights) < 2:
+            # at least two article symbols
+            for ch in " .":
+                sym_weights.setdefault(coder.symbol(('l', ch)), 0)
+        article_symbols = sorted(sym_weights)
+        article_idx = dict((s, i) for i, s in enumerate(article_symbols))
+        lt_articles = LenTableWriter(dict((article_idx[s], w) for s, w in sym_weights.items()))
+
+        # heading symbols and prefix/postfix length statistics
+        chr_weights = {}
+        prefix_weights = {}
+        postfix_weights = {}
+        prev = ""
+        max_len = 0
+        for key, number, text, unsorted in headings:
+            common = 0
+            while common < len(text) and common < len(prev) and text[common] == prev[common]:
+                common += 1
+            for ch in text[common:]:
+                chr_weights[ord(ch)] = chr_weights.get(ord(ch), 0) + 1
+            prefix_weights[common] = prefix_weights.get(common, 0) + 1
+            postfix_weights[len(text) - common] = postfix_weights.get(len(text) - common, 0) + 1
+            max_len = max(max_len, len(text))
+            prev = text
+        if len(chr_weights) < 2:
+            for ch in " -":
+                chr_weights.setdefault(ord(ch), 0)
+        heading_symbols = sorted(chr_weights)
+        heading_idx = dict((s, i) for i, s in enumerate(heading_symbols))
+        lt_headings = LenTableWriter(dict((heading_idx[s], w) for s, w in chr_weights.items()))
+        # page start reset prefix, all lengths must be encodable
+        lt_prefix = LenTableWriter(dict((i, prefix_weights.get(i, 0) + 1) for i in range(max_len + 1)))
+        lt_postfix = LenTableWriter(dict((i, postfix_weights.get(i, 0) + 1) for i in range(max_len + 1)))
+
+        # articles
+        arts = BitWriter()
+        references = {}
+        for number in order:
+            arts.align()
+            references[number] = len(arts.data)
+            self._write_article(arts, coder, article_idx, lt_articles, articles[number], tokens[number])
+        articles_data = arts.getvalue()
+        max_ref = max(references.values())
+        ref_bits = tools.bit_length(max_ref) + 1
+        huffman2_number = 1 << (ref_bits - 1)
+
+        # decoder tables
+        dec = BitWriter()
+        if self.is_abbreviation:
+            dec.write_int(len(prefix))
+            for ch in prefix:
+                dec.write_bits(ord(ch) ^ 0x879A, 16)
+            write_symbols(dec, article_symbols, 0x1325)
+            write_symbols(dec, heading_symbols, 0x1325)
+        else:
+            dec.write_int(len(prefix))
+            dec.write_unicode(prefix)
+            write_symbols(dec, article_symbols)
+            write_symbols(dec, heading_symbols)
+        lt_articles.write(dec)
+        lt_headings.write(dec)
+        if self.version in (0x141004, 0x151005):
+            lt_postfix.write(dec)
+            dec.write_bits(0, 32)
+            lt_prefix.write(dec)
+        else:
+            lt_prefix.write(dec)
+            lt_postfix.write(dec)
+        dec.write_bits(huffman2_number, 32)
+        dec.write_bits(huffman2_number, 32)
+        decoder_data = dec.getvalue()
+
+        # annotation
+        if self.annotation:
+            ann = BitWriter()
+            if len(self.annotation) >= 0xFFFF:
+                raise LsdError("Annotation too long")
+            self._write_article(ann, coder, article_idx, lt_articles, self.annotation, annotation_tokens)
+            annotation_data = ann.getvalue()
+        else:
+            annotation_data = b""
+
+        pages = self._write_pages(headings, references, lt_headings, heading_idx, lt_prefix, lt_postfix,
+                                  ref_bits)
+
+        # meta
+        meta = BitWriter()
+        name = self.name[:255]
+        meta.write_byte(len(name))
+        meta.write_unicode(name, False)
+        for text in (headings[0][2], headings[-1][2]):
+            text = text[:255]
+            meta.write_byte(len(text))
+            meta.write_unicode(text, False)
+        capitals = "".join(sorted(set(h[2][:1].upper() for h in headings if h[2])))
+        meta.write_bytes(struct.pack('<L', len(capitals)))
+        meta.write_unicode(capitals, False)
+        icon = self.icon or b""
+        meta.write_bytes(struct.pack('<H', len(icon)))
+        meta.write_bytes(icon)
+        meta_size = len(meta.getvalue()) + 4 * 2
+        if self.version > 0x140000:
+            meta_size += 4 * 3
+
+        header_size = 52
+        annotation_offset = header_size + meta_size
+        dictionary_encoder_offset = annotation_offset + len(annotation_data)
+        articles_offset = dictionary_encoder_offset + len(decoder_data)
+        pages_offset = articles_offset + len(articles_data)
+        pages_end = pages_offset + len(pages)
+
+        if self.version > 0x140000:
+            # header checksum, unknown algorithm
+            meta.write_bytes(struct.pack('<L', 0))
+        meta.write_bytes(struct.pack('<LL', pages_end, pages_end))
+        if self.version > 0x140000:
+            meta.write_bytes(struct.pack('<LL', 0, 0))
+
+        body = bytearray(meta.getvalue() + annotation_data + decoder_data + articles_data + pages)
+        if self.is_x6_system:
+            encrypt_block_x6(body, annotation_offset - header_size, dictionary_encoder_offset - header_size)
+            encrypt_block_x6(body, dictionary_encoder_offset - header_size, articles_offset - header_size)
+            refs = sorted(references.values()) + [pages_offset - articles_offset]
+            for i in range(len(refs) - 1):
+                encrypt_block_x6(body, articles_offset - header_size + refs[i],
+                                 articles_offset - header_size + refs[i + 1])
+        checksum = zlib.crc32(bytes(body)) & 0xffffffff
+        head = b"LingVo\x00\x00" + struct.pack(
+            '<9L4H', self.version, 0, checksum, len(headings), annotation_offset,
+            dictionary_encoder_offset, articles_offset, pages_offset, 0, 0, 0,
+            self.source_language, self.target_language)
+        return head + bytes(body)
+
+    def _write_article(self, bw, coder, article_idx, lt_articles, text, tokens):
+        size = len(text)
+        if size >= 0xFFFF:
+            bw.write_bits(0xFFFF, 16)
+            bw.write_bits(size, 32)
+        else:
+            bw.write_bits(size, 16)
+        prefix_bits = tools.bit_length(len(coder.prefix))
+        size_bits = tools.bit_length(size)
+        for t in tokens:
+            bw.write_bits(*lt_articles.encode(article_idx[coder.symbol(t)]))
+            if t[0] == 'p':
+                bw.write_bits(t[1], prefix_bits)
+            elif t[0] == 'b':
+                bw.write_bits(t[1], size_bits)
+
+    @staticmethod
+    def _heading_pieces(known_prefix, text, unsorted, reference, lt_headings, heading_idx,
+                        lt_prefix, lt_postfix, ref_bits):
+        common = 0
+        while common < len(text) and common < len(known_prefix) and text[common] == known_prefix[common]:
+            common += 1
+        res = [lt_prefix.encode(common), lt_postfix.encode(len(text) - common)]
+        for ch in text[common:]:
+            res.append(lt_headings.encode(heading_idx[ord(ch)]))
+        res.append((reference, ref_bits))
+        if unsorted:
+            if len(unsorted) > 255:
+                raise LsdError("Too many unsorted chars in heading: %s" % text)
+            res.append((1, 1))
+            res.append((len(unsorted), 8))
+            for idx, ch in unsorted:
+                if idx > 255:
+                    raise LsdError("Too long heading: %s" % text)
+                res.append((idx, 8))
+                res.append((ord(ch), 16))
+        else:
+            res.append((0, 1))
+        return res
+
+    def _write_pages(self, headings, references, lt_headings, heading_idx, lt_prefix, lt_postfix, ref_bits):
+        capacity = PAGE_SIZE * 8 - PAGE_HEADER_BITS
+        pages = []
+        current = []
+        used = 0
+        known_prefix = ""
+        for key, number, text, unsorted in headings:
+            pieces = self._heading_pieces(known_prefix, text, unsorted, references[number], lt_headings,
+                                          heading_idx, lt_prefix, lt_postfix, ref_bits)
+            bits = sum(c for v, c in pieces)
+            if used + bits > capacity and current:
+                pages.append(current)
+                current = []
+                used = 0
+                pieces = self._heading_pieces("", text, unsorted, references[number], lt_headings,
+                                              heading_idx, lt_prefix, lt_postfix, ref_bits)
+                bits = sum(c for v, c in pieces)
+            if bits > capacity:
+                raise LsdError("Heading not fit to the page: %s" % text)
+            current.append(pieces)
+            used += bits
+            known_prefix = text
+        pages.append(current)
+
+        count = len(pages)
+        parents = {}
+        # internal pages levels after the leaf pages: [[child number, ...], ...] by the page number
+        internal = []
+        level = list(range(count))
+        while self.fanout is not None and len(level) > 1:
+            upper = []
+            for i in range(0, len(level), self.fanout):
+                number = count + len(internal)
+                internal.append(level[i:i + self.fanout])
+                for child in level[i:i + self.fanout]:
+                    parents[child] = number
+                upper.append(number)
+            level = upper
+
+        res = bytearray()
+        for number, page in enumerate(pages):
+            bw = self._page_header(True, number, number - 1 if number > 0 else 0xFFFF, parents.get(number, 0xFFFF),
+                                   number + 1 if number + 1 < count else 0xFFFF, len(page))
+            for pieces in page:
+                bw.write_pieces(pieces)
+            data = bw.getvalue()
+            res.extend(data)
+            res.extend(b"\x00" * (PAGE_SIZE - len(data)))
+        for idx, children in enumerate(internal):
+            number = count + idx
+            # siblings: the same parent level
+            prev = number - 1 if idx > 0 and parents.get(number - 1) == parents.get(number) else 0xFFFF
+            next_page = number + 1 if idx + 1 < len(internal) and parents.get(number + 1) == parents.get(number) \
+                else 0xFFFF
+            data = self._page_header(False, number, prev, parents.get(number, 0xFFFF), next_page,
+                                     len(children)).getvalue()
+            res.extend(data)
+            res.extend(b"\x00" * (PAGE_SIZE - len(data)))
+        return bytes(res)
+
+    @staticmethod
+    def _page_header(is_leaf, number, prev, parent, next_page, count):
+        bw = BitWriter()
+        bw.write_bits(1 if is_leaf else 0, 1)
+        for value in (number, prev, parent, next_page, count):
+            bw.write_bits(value, 16)
+        bw.align()
+        return bw
+
+    def write(self, filename):
+        data = self.build()
+        with open(filename, 'wb') as fp:
+            fp.write(data)
+        return len(data)
+
+
+def encrypt_block_x6(record, start, end, key=0x7f):
+    """ reverse lsdfile.xor_decode_x6, in place """
+    for i in range(start, end):
+        byte = record[i] ^ key
+        record[i] = byte
+        key = xor_pad[byte]
+    return key
+
+
+def read_dsl(filename):
+    """ minimal dsl reader: return (properties, [([headings], article), ...]) """
+    with open(filename, 'rb') as fp:
+        data = fp.read()
+    if data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        text = data.decode('utf-16', 'surrogatepass')
+    else:
+        text = data.decode('utf-8-sig')
+    props = {}
+    entries = []
+    headings = []
+    body = []
+
+    def flush():
+        if headings:
+            entries.append((list(headings), "\n".join(body)))
+        del headings[:]
+        del body[:]
+
+    for line in text.splitlines():
+        if line.startswith('#') and not entries and not headings:
+            parts = line[1:].split(None, 1)
+            if parts:
+                props[parts[0]] = parts[1].strip().strip('"') if len(parts) > 1 else ""
+            continue
+        if line == "":
+            continue
+        if line[0] in ' \t':
+            body.append(line[1:] if line[0] == '\t' else line.lstrip(' '))
+        else:
+            if body:
+                flush()
+            headings.append(line)
+    flush()
+    return props, entries
+
+
+_SYLLABLES = ("ka", "to", "ri", "ne", "so", "mu", "la", "pe", "di", "vo", "stra", "bel", "qua", "ing",
+              "tion", "er", "ob", "um", "ex", "ant")
+
+
+def random_word(rnd, min_syllables=1, max_syllables=4):
+    return "".join(rnd.choice(_SYLLABLES) for _ in range(rnd.randint(min_syllables, max_syllables)))
+
+
+def random_corpus(count, seed=0, article_words=30):
+    """ generate count entries: [([headings], article), ...] """
+    rnd = random.Random(seed)
+    entries = []
+    used = set()
+    while len(entries) < count:
+        word = random_word(rnd)
+        if rnd.random() < 0.2:
+            word += " " + random_word(rnd)
+        if word in used:
+            word += str(len(entries))
+        used.add(word)
+        headings = [word]
+        if rnd.random() < 0.05:
+            headings.append(word + "{(s)}")
+        lines = []
+        for n in range(rnd.randint(1, 4)):
+            words = [random_word(rnd) for _ in range(rnd.randint(1, article_words))]
+            lines.append("[m1]%d) [trn]%s[/trn][/m]" % (n + 1, " ".join(words)))
+        entries.append((headings, "\n".join(lines)))
+    return entries
+
+
+def language_code(name, default):
+    """ lang_map code by the dsl language name """
+    for code, lang in tools.lang_map.items():
+        if lang == name:
+            return code
+    return default
+
+
+def get_arg_parser():
+    p = argparse.ArgumentParser(description='Encode dsl or random corpus to the Lingvo lsd dictionary')
+    g = p.add_mutually_exclusive_group(required=True)
+    g.add_argument("-i", "--input", help='Dsl dictionary to encode')
+    g.add_argument("-r", "--random", type=int, help='Random corpus entries count')
+    p.add_argument("-o", "--output", required=True, help="Output lsd file")
+    p.add_argument("-f", "--format", type=lambda value: int(value, 0), default=0x142001,
+                   help="Dictionary version: %s" % ", ".join(hex(v) for v in SUPPORTED_VERSIONS))
+    p.add_argument("-s", "--seed", type=int, default=0, help="Random corpus seed")
+    p.add_argument("-n", "--name", help="Dictionary name")
+    p.add_argument('--version', action='version', version='%(prog)s ' + __version__)
+    return p
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    if args.input:
+        props, entries = read_dsl(args.input)
+    else:
+        props, entries = {}, random_corpus(args.random, args.seed)
+    name = args.name or props.get("NAME", "")
+    w = LsdWriter(args.format, name,
+                  language_code(props.get("INDEX_LANGUAGE"), 1033),
+                  language_code(props.get("CONTENTS_LANGUAGE"), 1049))
+    for headings, article in entries:
+        w.add(headings, article)
+    size = w.write(args.output)
+    print("Write %s: %d entries, %d bytes" % (args.output, len(entries), size))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
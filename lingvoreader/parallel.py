@@ -0,0 +1,78 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import multiprocessing
+
+from lingvoreader.articleheading import ArticleHeading
+
+__author__ = 'sv99'
+
+
+# worker processes open the dictionary with mmap, so the input shared
+# through the page cache, and read decoder tables once
+
+ARTICLES_CHUNK = 256
+PAGES_CHUNK = 64
+
+_worker_lsd = None
+
+
+def _init_worker(dict_file):
+    global _worker_lsd
+    from lingvoreader.lsdfile import LsdFile
+    _worker_lsd = LsdFile(dict_file, use_mmap=True)
+    _worker_lsd.read()
+
+
+def _decode_articles(ranges):
+    res = []
+    heading = ArticleHeading()
+    for reference, next_reference in ranges:
+        heading.reference = reference
+        heading.next_reference = next_reference
+        res.append(_worker_lsd.read_article(heading))
+    return res
+
+
+def _decode_pages(page_numbers):
+    return [_worker_lsd.read_page(number) for number in page_numbers]
+
+
+def _iter_pool(dict_file, jobs, func, chunks):
+    """ results of func for each chunk in the chunks order """
+    pool = multiprocessing.Pool(jobs, _init_worker, (dict_file,))
+    completed = False
+    try:
+        for res in pool.imap(func, chunks):
+            yield res
+        completed = True
+    finally:
+        if completed:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def iter_articles(lsd, jobs, chunk_size=ARTICLES_CHUNK):
+    """ decode lsd.headings articles in the worker processes: (heading, article) """
+    headings = lsd.headings
+    ranges = [(h.reference, h.next_reference) for h in headings]
+    chunks = [ranges[i:i + chunk_size] for i in range(0, len(ranges), chunk_size)]
+    idx = 0
+    for articles in _iter_pool(lsd.filename, jobs, _decode_articles, chunks):
+        for article in articles:
+            yield headings[idx], article
+            idx += 1
+
+
+def iter_pages(lsd, jobs, chunk_size=PAGES_CHUNK):
+    """
+    decode leaf pages in the worker processes,
+    each page started with the empty prefix: [heading, ...] in the pages order
+    """
+    numbers = list(range(lsd.pages_count))
+    chunks = [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+    for pages in _iter_pool(lsd.filename, jobs, _decode_pages, chunks):
+        for headings in pages:
+            yield headings
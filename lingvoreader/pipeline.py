@@ -0,0 +1,140 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+import threading
+from timeit import default_timer as timer
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+from lingvoreader import tools
+
+__author__ = 'sv99'
+
+
+# decoded entries passed through the bounded queue to the writer thread,
+# writer encode entries and write them by the large batches,
+# so the decoding and the output file latency overlapped
+
+QUEUE_DEPTH = 256
+BATCH_SIZE = 1 << 20
+# producer check the writer error while waiting
+_PUT_TIMEOUT = 0.1
+
+_DONE = object()
+
+
+class PipelineStats:
+    def __init__(self):
+        self.items = 0
+        self.batches = 0
+        self.bytes = 0
+        # queue full, decoding waited for the writer
+        self.put_stalls = 0
+        self.put_stall_time = 0.0
+        # queue empty, writer waited for the decoding
+        self.get_stalls = 0
+        self.get_stall_time = 0.0
+
+    def dump(self):
+        print("Pipeline:")
+        print("    Entries:           %d" % self.items)
+        print("    Batches:           %d (%d bytes)" % (self.batches, self.bytes))
+        print("    Writer stalls:     %d (%s)" % (self.put_stalls, tools.display_time(self.put_stall_time)))
+        print("    Decoder stalls:    %d (%s)" % (self.get_stalls, tools.display_time(self.get_stall_time)))
+
+
+class PipelineWriter(threading.Thread):
+    """
+    writer thread: encode(item) bytes written to the fp by the batches
+    """
+    def __init__(self, fp, encode, depth=QUEUE_DEPTH, batch_size=BATCH_SIZE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fp = fp
+        self.encode = encode
+        self.batch_size = batch_size
+        self.stats = PipelineStats()
+        self.error = None
+        self._queue = queue.Queue(depth)
+
+    def put(self, item):
+        """ block while queue full, raise the writer error """
+        if self.error is not None:
+            raise self.error
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        self.stats.put_stalls += 1
+        start = timer()
+        try:
+            while True:
+                if self.error is not None:
+                    raise self.error
+                try:
+                    self._queue.put(item, timeout=_PUT_TIMEOUT)
+                    return
+                except queue.Full:
+                    pass
+        finally:
+            self.stats.put_stall_time += timer() - start
+
+    def close(self):
+        """ wait for the written rest, raise the writer error """
+        if self.error is None:
+            self.put(_DONE)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """ stop after the queued entries, writer error ignored """
+        try:
+            self.put(_DONE)
+        except Exception:
+            pass
+        self.join()
+
+    def _get(self):
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.stats.get_stalls += 1
+        start = timer()
+        item = self._queue.get()
+        self.stats.get_stall_time += timer() - start
+        return item
+
+    def _write(self, batch):
+        # not flushed: gzip flush per batch is the sync flush, worse compression
+        data = b"".join(batch)
+        self.fp.write(data)
+        self.stats.batches += 1
+        self.stats.bytes += len(data)
+
+    def run(self):
+        batch = []
+        size = 0
+        try:
+            while True:
+                item = self._get()
+                if item is _DONE:
+                    break
+                data = self.encode(item)
+                batch.append(data)
+                size += len(data)
+                self.stats.items += 1
+                if size >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+                    size = 0
+            if batch:
+                self._write(batch)
+        except Exception as e:
+            self.error = e
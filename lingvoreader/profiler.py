@@ -0,0 +1,117 @@
+# coding: utf-8
+from __future__ import unicode_literals, print_function, division, absolute_import
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+try:
+    from time import process_time as cpu_timer
+except ImportError:
+    # python 2
+    from time import clock as cpu_timer
+
+from lingvoreader import tools
+
+__author__ = 'sv99'
+
+
+# per stage wall and cpu time and the decoding counters,
+# stage time exclusive: nested stages time subtracted from the enclosing stage,
+# cpu time of the process, writer thread included
+
+STAGES = ('header', 'decoder', 'xor', 'headings', 'articles', 'annotation', 'write')
+# bits - read from the file by the tables, headings and articles decoding
+# symbols - huffman symbols decoded in the headings and articles
+# back_refs - back reference copies in the articles
+# bytes_written - output files size
+COUNTERS = ('bits', 'symbols', 'back_refs', 'bytes_written')
+
+
+class _NoStage:
+    """ stage context when profiling disabled """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NO_STAGE = _NoStage()
+
+
+class Profile:
+    def __init__(self, callback=None):
+        """ callback(name, wall, cpu) - called on each stage end with the exclusive time """
+        self.callback = callback
+        # name: [calls, wall, cpu]
+        self.stages = OrderedDict((name, [0, 0.0, 0.0]) for name in STAGES)
+        self.counters = OrderedDict((name, 0) for name in COUNTERS)
+        # [name, wall start, cpu start, nested wall, nested cpu]
+        self._stack = []
+
+    def start(self, name):
+        self._stack.append([name, timer(), cpu_timer(), 0.0, 0.0])
+
+    def stop(self, calls=1):
+        """ calls - added to the stage calls, 0 for the time without the call """
+        name, wall, cpu, nested_wall, nested_cpu = self._stack.pop()
+        wall = timer() - wall
+        cpu = cpu_timer() - cpu
+        if self._stack:
+            parent = self._stack[-1]
+            parent[3] += wall
+            parent[4] += cpu
+        wall -= nested_wall
+        cpu -= nested_cpu
+        stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+        stage[0] += calls
+        stage[1] += wall
+        stage[2] += cpu
+        if self.callback is not None:
+            self.callback(name, wall, cpu)
+
+    @contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def iterate(self, name, iterable):
+        """ items of the iterable, each item producing timed as the stage """
+        it = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = next(it)
+            except StopIteration:
+                # end of the items timed, calls - the items count
+                self.stop(0)
+                return
+            except BaseException:
+                self.stop()
+                raise
+            self.stop()
+            yield item
+
+    def count(self, name, value):
+        self.counters[name] += value
+
+    def as_dict(self):
+        """ json serializable: stages with calls, wall and cpu seconds, counters """
+        return {
+            "stages": OrderedDict((name, {"calls": calls, "wall": wall, "cpu": cpu})
+                                  for name, (calls, wall, cpu) in self.stages.items()),
+            "counters": OrderedDict(self.counters),
+        }
+
+    def dump(self):
+        print("Profile:")
+        for name, (calls, wall, cpu) in self.stages.items():
+            if calls > 0:
+                print("    %-18s %s (cpu %s, %d calls)" % (name + ":", tools.display_time(wall),
+                                                          tools.display_time(cpu), calls))
+        for name, value in self.counters.items():
+            print("    %-18s %d" % (name + ":", value))
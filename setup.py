@@ -48,6 +48,7 @@ setup(
     entry_points={
         'console_scripts': [
             'lsdreader = lingvoreader.lsdreader:main',
+            'lsdwriter = lingvoreader.lsdwriter:main',
         ]
     }
 )
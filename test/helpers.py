@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from lingvoreader import lsdwriter
+
+__author__ = 'sv99'
+
+
+def temp_dir(test):
+    """ temporary directory removed after the test """
+    tmp = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, tmp)
+    return tmp
+
+
+def make_dict(tmp, version, entries, filename=None, **kwargs):
+    """
+    dictionary with the (headings, article) entries written to the tmp directory: path,
+    filename - default d<version>.lsd, kwargs - LsdWriter options
+    """
+    path = os.path.join(tmp, filename or "d%x.lsd" % version)
+    w = lsdwriter.LsdWriter(version, **kwargs)
+    for headings, article in entries:
+        w.add(headings, article)
+    w.write(path)
+    return path
+
+
+def headings(m):
+    """ merged headings: [(ext texts, reference, next_reference)] """
+    return [([h.ext_text for h in item.headings], item.reference, item.next_reference) for item in m.headings]
+
+
+def items(m):
+    """ decoded dictionary: [(ext texts, reference, article)] """
+    return [([h.ext_text for h in heading.headings], heading.reference, article) for heading, article in m.dict]
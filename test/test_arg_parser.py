@@ -96,3 +96,39 @@ class TestArgParser(TestCase):
         self.assertTrue(args.all)
         self.assertFalse(args.verbose)
         self.assertEqual(args.outdir, 'test')
+
+    def test_jobs(self):
+        args = self.parser.parse_args('-i test -j 4'.split())
+        self.assertEqual(args.jobs, 4)
+        args = self.parser.parse_args('-i test'.split())
+        self.assertEqual(args.jobs, 1)
+
+    def test_parallel(self):
+        args = self.parser.parse_args('-a -p 8'.split())
+        self.assertTrue(args.all)
+        self.assertEqual(args.parallel, 8)
+
+    def test_queue_depth(self):
+        args = self.parser.parse_args('-i test -q 64'.split())
+        self.assertEqual(args.queue_depth, 64)
+        args = self.parser.parse_args('-i test'.split())
+        self.assertEqual(args.queue_depth, 0)
+
+    def test_probe(self):
+        args = self.parser.parse_args('-a --probe --json'.split())
+        self.assertTrue(args.probe)
+        self.assertTrue(args.json)
+        args = self.parser.parse_args('-i test'.split())
+        self.assertFalse(args.probe)
+
+    def test_profile(self):
+        args = self.parser.parse_args('-i test --profile'.split())
+        self.assertTrue(args.profile)
+        args = self.parser.parse_args('-i test'.split())
+        self.assertFalse(args.profile)
+
+    def test_index(self):
+        args = self.parser.parse_args('-i test --index'.split())
+        self.assertTrue(args.index)
+        args = self.parser.parse_args('-i test'.split())
+        self.assertFalse(args.index)
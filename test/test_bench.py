@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from lingvoreader import bench
+from test.helpers import temp_dir
+
+__author__ = 'sv99'
+
+
+class TestBench(TestCase):
+    def test_compare(self):
+        baseline = {"a": {"mb_s": 10.0}, "b": {"mb_s": 10.0}, "old": {"mb_s": 1.0}}
+        results = {"a": {"mb_s": 9.5}, "b": {"mb_s": 8.0}, "new": {"mb_s": 1.0}}
+        res = bench.compare(results, baseline, 0.1)
+        self.assertEqual([(name, regression) for name, base, current, change, regression in res],
+                         [("a", False), ("b", True)])
+        self.assertAlmostEqual(res[1][3], -0.2)
+
+    def test_run(self):
+        names = []
+        res = bench.run([0x151005], 30, 1, temp_dir(self), "0x151005", lambda name, r: names.append(name))
+        self.assertEqual(sorted(res), sorted(name + ".0x151005" for name in bench.DICTIONARY_BENCHMARKS))
+        self.assertEqual(sorted(names), sorted(res))
+        for r in res.values():
+            self.assertTrue(r["bytes"] > 0)
+            self.assertTrue(r["mb_s"] > 0)
+        self.assertTrue(res["end_to_end.0x151005"]["symbols"] > 0)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import print_function
+import random
 from unittest import TestCase
 from lingvoreader import bitstream
 
@@ -11,7 +12,7 @@ class TestBitStream(TestCase):
     def setUp(self):
         print("Creating a new BitStream...")
         # record - bytearray, not string!
-        self.record = bytearray('\x00\x01\x02\x03\x04\x05\x06\x07\x08')
+        self.record = bytearray(b'\x00\x01\x02\x03\x04\x05\x06\x07\x08')
         self.bst = bitstream.BitStream(self.record)
 
     def tearDown(self):
@@ -63,4 +64,102 @@ class TestBitStream(TestCase):
         self.assertEqual(self.bst.read_bits(4), 0)
         self.assertEqual(self.bst.read_bits(4), 1)
         self.assertEqual(self.bst.read_bits(4), 0)
-        self.assertEqual(self.bst.read_bits(8), 0x20)
\ No newline at end of file
+        self.assertEqual(self.bst.read_bits(8), 0x20)
+
+
+class TestByteBitStream(TestBitStream):
+    def setUp(self):
+        self.record = bytearray(b'\x00\x01\x02\x03\x04\x05\x06\x07\x08')
+        self.bst = bitstream.ByteBitStream(self.record)
+
+
+class TestBitStreamDiff(TestCase):
+    """ BitStream against the reference ByteBitStream """
+    def test_random_reads(self):
+        rnd = random.Random(1)
+        for trial in range(100):
+            record = bytearray(rnd.getrandbits(8) for _ in range(rnd.randint(8, 100)))
+            ref = bitstream.ByteBitStream(record)
+            bst = bitstream.BitStream(record)
+            while ref.pos < len(record) - 5:
+                op = rnd.random()
+                if op < 0.3:
+                    self.assertEqual(ref.read_bit(), bst.read_bit())
+                elif op < 0.8:
+                    count = rnd.randint(1, 32)
+                    self.assertEqual(ref.read_bits(count), bst.read_bits(count))
+                elif op < 0.85:
+                    ref.to_nearest_byte()
+                    bst.to_nearest_byte()
+                elif op < 0.9:
+                    self.assertEqual(ref.read_byte(), bst.read_byte())
+                elif op < 0.95:
+                    self.assertEqual(ref.read_int(), bst.read_int())
+                else:
+                    pos = rnd.randint(0, len(record) - 6)
+                    self.assertEqual(ref.seek(pos), bst.seek(pos))
+                self.assertEqual(ref.pos, bst.pos)
+                self.assertEqual(ref.in_byte_pos, bst.in_byte_pos)
+
+    def test_tail(self):
+        bst = bitstream.BitStream(bytearray(b'\xff\x01'))
+        bst.seek(1)
+        self.assertEqual(bst.read_bits(8), 1)
+        self.assertEqual(bst.read_bits(8), 0)
+
+    def test_modified_record(self):
+        record = bytearray(b'\x00\x01\x02\x03')
+        bst = bitstream.BitStream(record)
+        self.assertEqual(bst.read_bits(8), 0)
+        bst.seek(0)
+        record[0] = 0xFF
+        self.assertEqual(bst.read_bits(8), 0xFF)
+
+    def test_accumulator(self):
+        rnd = random.Random(4)
+        record = bytearray(rnd.getrandbits(8) for _ in range(100))
+        ref = bitstream.ByteBitStream(record)
+        bst = bitstream.BitStream(record)
+        ref.skip_bits(3)
+        bst.skip_bits(3)
+        bit, acc, acc_bit = bst.accumulator()
+        while bit < 700:
+            count = rnd.randint(1, 32)
+            if bit - acc_bit + count > 64:
+                acc, acc_bit = bst.refill(bit)
+            self.assertEqual((acc >> (64 - (bit - acc_bit) - count)) & ((1 << count) - 1), ref.read_bits(count))
+            bit += count
+        bst.commit(bit)
+        self.assertEqual(bst.bit_pos, ref.bit_pos)
+        self.assertEqual(bst.read_bits(16), ref.read_bits(16))
+
+    def check_bits_array(self, seed, max_count):
+        rnd = random.Random(seed)
+        for trial in range(50):
+            record = bytearray(rnd.getrandbits(8) for _ in range(rnd.randint(8, 400)))
+            ref = bitstream.BitStream(record)
+            bst = bitstream.BitStream(record)
+            skip = rnd.randint(0, 20)
+            ref.skip_bits(skip)
+            bst.skip_bits(skip)
+            width = rnd.randint(0, 32)
+            count = rnd.randint(0, max_count)
+            xor = rnd.choice((0, 0x1325))
+            expected = [ref.read_bits(width) ^ xor for _ in range(count)]
+            self.assertEqual(list(bst.read_bits_array(count, width, xor)), expected)
+            self.assertEqual((ref.pos, ref.in_byte_pos), (bst.pos, bst.in_byte_pos))
+            self.assertEqual(ref.read_bits(7), bst.read_bits(7))
+
+    def test_read_bits_array(self):
+        # fields after the record end read as zeros
+        self.check_bits_array(2, 200)
+
+    def test_read_bits_array_numpy(self):
+        if bitstream.numpy is None:
+            self.skipTest("numpy not installed")
+        min_count = bitstream.NUMPY_MIN_COUNT
+        bitstream.NUMPY_MIN_COUNT = 1
+        try:
+            self.check_bits_array(3, 200)
+        finally:
+            bitstream.NUMPY_MIN_COUNT = min_count
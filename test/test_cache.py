@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import tempfile
+from array import array
+from unittest import TestCase
+from lingvoreader import cache, lsdwriter
+from lingvoreader.lsdfile import LsdFile
+from test.helpers import temp_dir, make_dict, headings
+
+__author__ = 'sv99'
+
+
+class Exploit(object):
+    """ pickle calling the function on load """
+    def __reduce__(self):
+        return os.mkdir, (os.path.join(tempfile.gettempdir(), "lsdreader_cache_exploit"),)
+
+
+class TestCache(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.cache_dir = os.path.join(self.tmp, "cache")
+        self.entries = lsdwriter.random_corpus(100, seed=3)
+        self.filename = self.write_dictionary(self.entries)
+
+    def write_dictionary(self, entries):
+        return make_dict(self.tmp, 0x141004, entries)
+
+    def test_round_trip(self):
+        data = {
+            'text': u"текст \U00020000 \udc00",
+            'numbers': array('L', [0, 1, 0xFFFFFFFF]),
+            'nested': {'state': [(1, 2, [(3, 4)]), None], 'empty': array('L')},
+        }
+        cache.save(self.cache_dir, self.filename, 7, data)
+        res = cache.load(self.cache_dir, self.filename, 7)
+        self.assertEqual(res['text'], data['text'])
+        self.assertEqual(list(res['numbers']), [0, 1, 0xFFFFFFFF])
+        self.assertEqual(res['nested']['state'], [[1, 2, [[3, 4]]], None])
+        self.assertEqual(len(res['nested']['empty']), 0)
+        # texts in the utf-8 blob, not in the json header
+        with open(cache.cache_file(self.cache_dir, self.filename), 'rb') as f:
+            self.assertIn(u"текст".encode('utf-8'), f.read())
+
+    def test_stale(self):
+        cache.save(self.cache_dir, self.filename, 7, {'value': 1})
+        self.assertIsNone(cache.load(self.cache_dir, self.filename, 8))
+        self.write_dictionary(self.entries[:50])
+        self.assertIsNone(cache.load(self.cache_dir, self.filename, 7))
+
+    def test_corrupt(self):
+        cache.save(self.cache_dir, self.filename, 7, {'value': array('L', range(100))})
+        path = cache.cache_file(self.cache_dir, self.filename)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for garbage in (b"", data[:20], data[:-4], data[:30] + b"\xff" * 10 + data[40:], b"\x00" * 100):
+            with open(path, 'wb') as f:
+                f.write(garbage)
+            self.assertIsNone(cache.load(self.cache_dir, self.filename, 7))
+
+    def test_pickle_not_loaded(self):
+        os.makedirs(self.cache_dir)
+        marker = os.path.join(tempfile.gettempdir(), "lsdreader_cache_exploit")
+        if os.path.exists(marker):
+            os.rmdir(marker)
+        with open(cache.cache_file(self.cache_dir, self.filename), 'wb') as f:
+            pickle.dump(Exploit(), f)
+        self.assertIsNone(cache.load(self.cache_dir, self.filename, 7))
+        self.assertFalse(os.path.exists(marker))
+
+    def test_lsdfile(self):
+        with LsdFile(self.filename) as m:
+            m.parse()
+            expected = headings(m)
+            articles = [article for h, article in m.dict]
+        for _ in range(2):
+            # second time from the cache
+            with LsdFile(self.filename, cache_dir=self.cache_dir) as m:
+                m.parse()
+                self.assertEqual(headings(m), expected)
+                self.assertEqual([article for h, article in m.dict], articles)
+        with LsdFile(self.filename, cache_dir=self.cache_dir) as m:
+            texts, article = self.entries[20]
+            self.assertEqual([r for h, r in m.lookup(texts[0].upper())], [article])
+
+    def test_lsdfile_stale(self):
+        with LsdFile(self.filename, cache_dir=self.cache_dir) as m:
+            m.parse_headings()
+        # dictionary changed, cache decoded again
+        self.write_dictionary([([u"go"], u"changed"), ([u"stop"], u"stand")])
+        for _ in range(2):
+            with LsdFile(self.filename, cache_dir=self.cache_dir) as m:
+                self.assertEqual([r for h, r in m.lookup(u"go")], [u"changed"])
+
+    def test_lsdfile_corrupt(self):
+        with LsdFile(self.filename, cache_dir=self.cache_dir) as m:
+            m.parse_headings()
+            expected = headings(m)
+        # valid file with the foreign data, broken file
+        cache.save(self.cache_dir, self.filename, m.header.checksum, {'decoder': {'prefix': 1}})
+        for _ in range(2):
+            with LsdFile(self.filename, cache_dir=self.cache_dir) as m:
+                m.parse_headings()
+                self.assertEqual(headings(m), expected)
+            with open(cache.cache_file(self.cache_dir, self.filename), 'r+b') as f:
+                f.seek(12)
+                f.write(b"\x00" * 8)
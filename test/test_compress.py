@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import random
+from unittest import TestCase
+from lingvoreader import compress
+from test.helpers import temp_dir
+
+__author__ = 'sv99'
+
+
+class TestDictzip(TestCase):
+    def setUp(self):
+        self.filename = os.path.join(temp_dir(self), 'test.dsl.dz')
+        rnd = random.Random(1)
+        words = [bytes(bytearray(rnd.getrandbits(7) for _ in range(rnd.randint(1, 9)))) for _ in range(50)]
+        self.data = b" ".join(rnd.choice(words) for _ in range(20000))
+
+    def write(self, parts, chunk_length=1000):
+        with compress.DictzipFile(self.filename, chunk_length) as dz:
+            for part in parts:
+                dz.write(part)
+
+    def check(self, chunk_length=1000):
+        with gzip.open(self.filename, 'rb') as fp:
+            self.assertEqual(fp.read(), self.data)
+        with open(self.filename, 'rb') as fp:
+            chunks = compress.dictzip_chunks(fp)
+            pos = 0
+            for chunk in chunks:
+                data = compress.read_dictzip_chunk(fp, chunk)
+                self.assertEqual(data, self.data[pos:pos + chunk_length])
+                pos += len(data)
+            self.assertEqual(pos, len(self.data))
+        return chunks
+
+    def test_write(self):
+        self.write([self.data[i:i + 777] for i in range(0, len(self.data), 777)])
+        chunks = self.check()
+        self.assertEqual(len(chunks), (len(self.data) + 999) // 1000)
+
+    def test_empty(self):
+        self.data = b""
+        self.write([])
+        self.check()
+
+    def test_members(self):
+        max_chunks = compress.MAX_CHUNKS
+        compress.MAX_CHUNKS = 10
+        try:
+            self.write([self.data])
+        finally:
+            compress.MAX_CHUNKS = max_chunks
+        self.check()
+
+
+class TestOpenOutput(TestCase):
+    def test_gzip(self):
+        filename = os.path.join(temp_dir(self), 'test.dsl.gz')
+        with compress.open_output(filename, compress.GZIP) as fp:
+            fp.write(b"data")
+        with gzip.open(filename, 'rb') as fp:
+            self.assertEqual(fp.read(), b"data")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from array import array
+from unittest import TestCase
+from lingvoreader import lsdwriter, tools
+from lingvoreader.decoder import copy_back, LITERAL
+from lingvoreader.lsdfile import LsdFile, get_decoder_class, units_bytes
+from lingvoreader.profiler import Profile
+from test.helpers import temp_dir, make_dict
+
+__author__ = 'sv99'
+
+
+PREFIX = u"[m1][trn]common translation prefix[/trn][/m]"
+
+
+class TestCopyBack(TestCase):
+    def test_copy(self):
+        for res in (list(u"abcdef"), array('H', [ord(ch) for ch in u"abcdef"])):
+            self.assertEqual(list(copy_back(res, 1, 3)), list(res[1:4]))
+            # truncated on the buffer end, not repeated
+            self.assertEqual(list(copy_back(res, 4, 5)), list(res[4:]))
+            self.assertEqual(len(copy_back(res, 6, 2)), 0)
+
+
+class TestDecodeArticle(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.articles = [
+            # back references
+            u"ab" * 3000,
+            u" ".join(u"word%d" % (i % 50) for i in range(2000)),
+            # prefix references
+            PREFIX + u" " + PREFIX[5:20] + u" text",
+            # size over 0xFFFF
+            u"long " + u"".join(u"%05d" % i for i in range(14000)),
+            u"x",
+        ]
+
+    def test_references(self):
+        entries = [(u"word%d" % i, article) for i, article in enumerate(self.articles)]
+        for version in lsdwriter.SUPPORTED_VERSIONS:
+            filename = make_dict(self.tmp, version, entries, prefix=PREFIX)
+            profile = Profile()
+            with LsdFile(filename, profile=profile) as m:
+                for i, article in enumerate(self.articles):
+                    found = m.lookup(u"word%d" % i)
+                    self.assertEqual([r for h, r in found], [article], (hex(version), i))
+                    self.assertEqual(units_bytes(m.read_article_units(found[0][0])), article.encode('utf-16-le'))
+            self.assertGreater(profile.counters['back_refs'], 0, hex(version))
+
+
+PLAN = ('_heading_chars', '_article_kinds', '_article_sizes', '_article_values', '_article_units',
+        '_prefix_bits', '_reference1_bits', '_reference2_bits')
+
+
+class TestDecodePlan(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+
+    def write_dictionary(self, version, article):
+        return make_dict(self.tmp, version, [(u"word", article), (u"other", u"ab" * 100)], prefix=PREFIX)
+
+    def test_plan(self):
+        for version in lsdwriter.SUPPORTED_VERSIONS:
+            with LsdFile(self.write_dictionary(version, u"text")) as m:
+                m.read()
+                decoder = m.decoder
+                self.assertEqual(decoder._heading_chars, [tools.int2unichr(sym) for sym in decoder._heading_symbols])
+                for sym_idx, sym in enumerate(decoder._article_symbols):
+                    kind, value = decoder.article_symbol(sym)
+                    self.assertEqual(decoder._article_kinds[sym_idx], kind)
+                    self.assertEqual(decoder._article_values[sym_idx], value)
+                    self.assertEqual(decoder._article_sizes[sym_idx], 1 if kind == LITERAL else value)
+                self.assertEqual(decoder._prefix_bits, tools.bit_length(len(PREFIX)))
+                self.assertEqual(decoder._reference2_bits, tools.bit_length(decoder._huffman2Number))
+                self.assertIsNotNone(decoder._article_units)
+                # same plan from the cached state
+                restored = get_decoder_class(version)(m.bstr)
+                restored.set_state(decoder.get_state())
+                for name in PLAN:
+                    self.assertEqual(getattr(restored, name), getattr(decoder, name), (hex(version), name))
+
+    def test_non_bmp(self):
+        # system dictionaries literals outside BMP, references index characters: no code units plan
+        for version in (0x131001, 0x141004, 0x151005):
+            with LsdFile(self.write_dictionary(version, u"wide \U00020000")) as m:
+                m.read()
+                self.assertIsNone(m.decoder._article_units)
+                self.assertEqual([r for h, r in m.lookup(u"word")], [u"wide \U00020000"])
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from unittest import TestCase
+from lingvoreader import lsdwriter, index, LsdError
+from lingvoreader.lsdfile import LsdFile
+from test.helpers import temp_dir, make_dict
+
+__author__ = 'sv99'
+
+
+def build_index(filename):
+    with LsdFile(filename) as m:
+        return m.build_index()
+
+
+def found(m, word):
+    return [([h.ext_text for h in heading.headings], article) for heading, article in m.lookup(word)]
+
+
+class TestIndex(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.entries = lsdwriter.random_corpus(100, seed=2)
+        self.entries.append(([u"go", u"{to }go"], u"идти"))
+        self.entries.append(([u"Go"], u"game"))
+        self.filename = self.write_dictionary(self.entries)
+
+    def write_dictionary(self, entries):
+        return make_dict(self.tmp, 0x151005, entries, filename="test.lsd", name=u"Test")
+
+    def test_lookup(self):
+        build_index(self.filename)
+        words = [headings[0] for headings, article in self.entries[::5]] + [u"GO", u"missing"]
+        with LsdFile(self.filename, use_index=True) as mi, LsdFile(self.filename) as m:
+            self.assertIsNotNone(mi.open_index())
+            for word in words:
+                self.assertEqual(found(mi, word), found(m, word), word)
+
+    def test_not_built(self):
+        # lookup by the pages: no headings decoding, nothing written
+        with LsdFile(self.filename, use_index=True) as m:
+            self.assertEqual(found(m, u"GO"), [([u"Go"], u"game"), ([u"go", u"{to }go"], u"идти")])
+            self.assertIsNone(m.open_index())
+            self.assertFalse(m.headings_readed)
+        self.assertEqual(os.listdir(self.tmp), ["test.lsd"])
+
+    def test_unsorted_parts(self):
+        # matched by the text without the unsorted parts with and without the index
+        build_index(self.filename)
+        for use_index in (False, True):
+            with LsdFile(self.filename, use_index=use_index) as m:
+                if use_index:
+                    self.assertIsNotNone(m.open_index())
+                self.assertEqual(found(m, u"go"), [([u"Go"], u"game"), ([u"go", u"{to }go"], u"идти")])
+                self.assertEqual(found(m, u"to go"), [])
+                self.assertEqual(found(m, u"{to }go"), [])
+
+    def test_stale(self):
+        with LsdFile(self.filename) as m:
+            path = m.build_index()
+            checksum = m.header.checksum
+            size = m.bstr.length
+        with index.HeadwordIndex(path) as idx:
+            self.assertFalse(idx.stale(checksum, size))
+            # go, {to }go and Go headings
+            self.assertEqual(len(idx.find(u"go")), 3)
+        # dictionary changed, stale index not used and not rebuilt on the lookup
+        self.write_dictionary([([u"go"], u"changed"), ([u"stop"], u"stand")])
+        with LsdFile(self.filename, use_index=True) as m:
+            self.assertIsNone(index.load(path, m.header.checksum, m.bstr.length))
+            self.assertEqual(found(m, u"go"), [([u"go"], u"changed")])
+            self.assertIsNone(m.open_index())
+            m.build_index()
+            self.assertEqual(len(m.open_index()), 2)
+            self.assertEqual(found(m, u"go"), [([u"go"], u"changed")])
+
+    def test_broken(self):
+        path = index.index_file(self.filename)
+        with open(path, 'wb') as f:
+            f.write(b"LSDIDX\x00\x00" + b"\x01" * 40)
+        self.assertRaises(LsdError, index.HeadwordIndex, path)
+        self.assertIsNone(index.load(path, 0, 0))
+        with LsdFile(self.filename, use_index=True) as m:
+            self.assertIsNone(m.open_index())
+            self.assertEqual([r for h, r in m.cursor().lookup(u"Go")], [u"game", u"идти"])
+
+    def test_not_writable(self):
+        # sidecar can't be written: error raised, no temporary files left
+        path = index.index_file(self.filename)
+        os.makedirs(os.path.join(path, "busy"))
+        with LsdFile(self.filename, use_index=True) as m:
+            self.assertRaises((IOError, OSError), m.build_index)
+            self.assertIsNone(m.open_index())
+            self.assertEqual(found(m, u"go"), [([u"Go"], u"game"), ([u"go", u"{to }go"], u"идти")])
+        self.assertEqual(sorted(os.listdir(self.tmp)), ["test.lsd", "test.lsd.idx"])
+
+    def test_prefix_search(self):
+        # same headings from the index and from the pages, unsorted parts not matched
+        build_index(self.filename)
+        prefixes = [u"", u"g", u"GO", u"to", u"missing"] + [headings[0][:2] for headings, article in self.entries[::9]]
+        with LsdFile(self.filename, use_index=True) as mi, LsdFile(self.filename) as m:
+            self.assertIsNotNone(mi.open_index())
+            self.assertNotIn(u"{to }go", [h.ext_text for item in mi.prefix_search(u"to", None) for h in item.headings])
+            for prefix in prefixes:
+                for limit in (1, 3, None):
+                    res = []
+                    for lsd in (mi, m):
+                        res.append([([h.ext_text for h in item.headings], item.reference, lsd.read_article(item))
+                                    for item in lsd.prefix_search(prefix, limit)])
+                    self.assertEqual(res[0], res[1], (prefix, limit))
+            self.assertEqual([h.ext_text for item in m.prefix_search(u"go", None) for h in item.headings],
+                             [u"Go", u"go", u"{to }go"])
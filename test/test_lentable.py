@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+from unittest import TestCase
+from lingvoreader import tools, LsdError
+from lingvoreader.bitstream import BitStream, ByteBitStream
+from lingvoreader.lentable import LenTable
+
+__author__ = 'sv99'
+
+
+def random_lengths(rnd, count):
+    """ code lengths of the random complete prefix code """
+    lengths = [0]
+    while len(lengths) < count:
+        i = rnd.randrange(len(lengths))
+        depth = lengths.pop(i)
+        lengths += [depth + 1, depth + 1]
+    return sorted(lengths)
+
+
+def make_record(lengths, symidx, tail):
+    """ LenTable header, entries sorted by code length, random tail bits """
+    bits_per_len = tools.bit_length(max(lengths))
+    idx_bit_size = tools.bit_length(len(lengths))
+    bits = format(len(lengths), '032b') + format(bits_per_len, '08b')
+    for sym, length in zip(symidx, lengths):
+        bits += format(sym, '0%db' % idx_bit_size) + format(length, '0%db' % bits_per_len)
+    bits += tail
+    bits += '0' * (-len(bits) % 8)
+    return bytearray(int(bits[i:i + 8], 2) for i in range(0, len(bits), 8))
+
+
+def place_codes(lengths):
+    """ LingvoEngine recursive symbols placement: {sym_idx: code string} """
+    tree = {}  # code string: sym_idx for the leaf, None for the node
+    res = {}
+
+    def place(sym_idx, code, size):
+        for bit in '01':
+            child = code + bit
+            if size == 1:
+                if child not in tree:
+                    tree[child] = sym_idx
+                    res[sym_idx] = child
+                    return True
+            else:
+                if child not in tree:
+                    tree[child] = None
+                if tree[child] is None and place(sym_idx, child, size - 1):
+                    return True
+        return False
+
+    for sym_idx, length in lengths:
+        place(sym_idx, '', length)
+    return res
+
+
+class TestLenTable(TestCase):
+    def check(self, seed, count):
+        rnd = random.Random(seed)
+        lengths = random_lengths(rnd, count)
+        symidx = list(range(count))
+        rnd.shuffle(symidx)
+        tail = ''.join(rnd.choice('01') for _ in range(4000))
+        record = make_record(lengths, symidx, tail)
+        table = LenTable(BitStream(record))
+        ref = LenTable(BitStream(record))
+        # lookup tables from the state, tree not built
+        restored = LenTable(BitStream(record), table.get_state())
+        restored.bstr.skip_bits(ref.bstr.bit_pos)
+        start = ref.bstr.pos
+        while ref.bstr.pos < len(record) - (start + 8):
+            sym_idx = ref.decode_tree()
+            self.assertEqual(table.decode(), sym_idx)
+            self.assertEqual(restored.decode(), sym_idx)
+            self.assertEqual((table.bstr.pos, table.bstr.in_byte_pos), (ref.bstr.pos, ref.bstr.in_byte_pos))
+
+    def test_small(self):
+        self.check(1, 2)
+        self.check(2, 5)
+
+    def test_empty(self):
+        # table without symbols, as the baseline read it
+        table = LenTable(BitStream(bytearray(8)))
+        self.assertEqual(table.get_state()[:3], (0, 0, []))
+        self.assertRaises(LsdError, table.decode)
+        self.assertRaises(LsdError, table.decode_many, 1)
+        table = LenTable(BitStream(bytearray(8)), (0, 0, []))
+        self.assertEqual(list(table.decode_many(0)), [])
+
+    def test_short_codes(self):
+        self.check(3, 100)
+
+    def test_long_codes(self):
+        # random splitting gives codes longer than the TABLE_BITS
+        self.check(4, 2000)
+
+    def test_file_order(self):
+        # entries not sorted by the length, incomplete and overfull codes
+        rnd = random.Random(5)
+        for trial in range(200):
+            count = rnd.randint(2, 60)
+            lengths = [(sym, rnd.randint(1, 8)) for sym in range(count)]
+            if trial % 2:
+                lengths = list(zip(range(count), random_lengths(rnd, count)))
+            rnd.shuffle(lengths)
+            codes = dict((sym, format(code, '0%db' % length))
+                         for sym, code, length in LenTable.assign_codes(lengths))
+            self.assertEqual(codes, place_codes(lengths))
+
+    def check_batch(self, stream_class):
+        rnd = random.Random(6)
+        lengths = random_lengths(rnd, 300)
+        symidx = list(range(300))
+        tail = ''.join(rnd.choice('01') for _ in range(20000))
+        record = make_record(lengths, symidx, tail)
+        table = LenTable(stream_class(record))
+        ref = LenTable(stream_class(record))
+        # symbols 0..9 followed by the field of 5 or 13 bits
+        kinds = [1 + sym % 2 if sym < 10 else 0 for sym in range(300)]
+        sizes = [sym % 4 + 1 for sym in range(300)]
+        widths = (0, 5, 13)
+        for i in range(50):
+            expected = [ref.decode() for _ in range(i)]
+            self.assertEqual(list(table.decode_many(i)), expected)
+            total = rnd.randint(1, 40)
+            symbols, fields = table.decode_until(total, sizes, kinds, widths)
+            expected_fields = []
+            for sym in symbols:
+                self.assertEqual(sym, ref.decode())
+                if widths[kinds[sym]]:
+                    expected_fields.append(ref.bstr.read_bits(widths[kinds[sym]]))
+            self.assertEqual(list(fields), expected_fields)
+            self.assertTrue(sum(sizes[sym] for sym in symbols) >= total)
+            self.assertTrue(sum(sizes[sym] for sym in symbols[:-1]) < total)
+            self.assertEqual((table.bstr.pos, table.bstr.in_byte_pos), (ref.bstr.pos, ref.bstr.in_byte_pos))
+
+    def test_batch(self):
+        self.check_batch(BitStream)
+        self.check_batch(ByteBitStream)
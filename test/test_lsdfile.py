@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import random
+import struct
+from array import array
+from unittest import TestCase
+from lingvoreader import lsdfile, lsdwriter, parallel
+from lingvoreader.bitstream import BitStream
+from test.helpers import temp_dir, make_dict, headings, items
+
+__author__ = 'sv99'
+
+
+def xor_block_x6(record, start, end, key=0x7f):
+    """ in place byte by byte decoding, reference for the xor_decode_x6 """
+    for i in range(start, end):
+        byte = record[i]
+        record[i] = byte ^ key
+        key = lsdfile.xor_pad[byte]
+    return key
+
+
+class TestXorDecode(TestCase):
+    def test_empty(self):
+        self.assertEqual(lsdfile.xor_decode_x6(b""), b"")
+
+    def test_random(self):
+        rnd = random.Random(1)
+        for size in (1, 2, 7, 100, 4096):
+            data = bytes(bytearray(rnd.getrandbits(8) for _ in range(size)))
+            expected = bytearray(data)
+            xor_block_x6(expected, 0, size)
+            self.assertEqual(lsdfile.xor_decode_x6(data), bytes(expected))
+            # source not modified
+            self.assertEqual(lsdfile.xor_decode_x6(bytearray(data)), bytes(expected))
+
+    def test_key(self):
+        data = b"\x01\x02\x03"
+        expected = bytearray(data)
+        xor_block_x6(expected, 0, 3, 0x10)
+        self.assertEqual(lsdfile.xor_decode_x6(data, 0x10), bytes(expected))
+
+
+class TestIndentUnits(TestCase):
+    def check(self, text):
+        units = array('H', [ord(ch) for ch in text])
+        self.assertEqual(lsdfile.indent_units(units), lsdfile.LsdFile.normalize_article(text).encode('utf-16-le'))
+
+    def test_indent(self):
+        self.check(u"")
+        self.check(u"line")
+        self.check(u"\n[m1]статья\n\nend\n")
+
+    def test_unaligned(self):
+        # 0x0A00..0x0AFF code unit before the 0x??00 code unit gives b'\n\x00' in the middle
+        self.check(u"ਊĀ\n਀\n")
+
+
+def make_dictionary_start(version, name=u"Test", icon=b"", magic=b"LingVo\x00\x00"):
+    """ header and dictionary info, offsets only for the pages count """
+    res = magic + struct.pack('<9L4H', version, 0, 0x1234, 10, 0, 0, 0, 1024, 0, 0, 0, 1033, 1049)
+
+    def text(value):
+        return struct.pack('<B', len(value)) + value.encode('utf-16-le')
+    res += text(name) + text(u"a") + text(u"z")
+    res += struct.pack('<L', 2) + u"AZ".encode('utf-16-le')
+    res += struct.pack('<H', len(icon)) + icon
+    res += struct.pack('<5L', 0, 1024 + 3 * 512, 1024 + 3 * 512, 0, 0)
+    return res
+
+
+class TestProbe(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+
+    def probe(self, data):
+        path = os.path.join(self.tmp, "test.lsd")
+        with open(path, 'wb') as f:
+            f.write(data)
+        return lsdfile.Probe(path)
+
+    def test_info(self):
+        m = self.probe(make_dictionary_start(0x151005) + b"\x00" * 10000)
+        self.assertTrue(m.supported)
+        self.assertTrue(m.xored)
+        self.assertEqual(m.header.entries_count, 10)
+        self.assertEqual(m.info.name, u"Test")
+        self.assertEqual(m.info.capitals, u"AZ")
+        self.assertEqual(m.pages_count, 3)
+        info = m.as_dict()
+        self.assertEqual(info["version"], "0x151005")
+        self.assertEqual(info["last_heading"], u"z")
+
+    def test_large_icon(self):
+        icon = bytes(bytearray(range(256))) * 40
+        m = self.probe(make_dictionary_start(0x142001, icon=icon))
+        self.assertEqual(m.info.icon, icon)
+        self.assertEqual(m.pages_count, 3)
+
+    def test_not_supported(self):
+        m = self.probe(make_dictionary_start(0x161001))
+        self.assertFalse(m.supported)
+        self.assertEqual(m.info.name, u"Test")
+
+    def test_errors(self):
+        with self.assertRaises(lsdfile.LsdError):
+            self.probe(make_dictionary_start(0x142001, magic=b"Lingvo\x00\x00"))
+        with self.assertRaises(lsdfile.LsdError):
+            self.probe(make_dictionary_start(0x142001, icon=b"\x00" * 5000)[:4500])
+        with self.assertRaises(lsdfile.LsdError):
+            self.probe(b"LingVo")
+
+
+class TestLookup(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.entries = lsdwriter.random_corpus(150, seed=7)
+        self.entries.append(([u"colour", u"color"], u"цвет"))
+        self.entries.append(([u"Zzz"], u"sleep"))
+
+    def test_lookup(self):
+        for version in (0x142001, 0x131001, 0x151005, 0x155001):
+            with lsdfile.LsdFile(make_dict(self.tmp, version, self.entries)) as m:
+                for headings, article in self.entries[::7]:
+                    text = headings[0]
+                    if u"{" in text:
+                        continue
+                    self.assertIn(article, [r for h, r in m.lookup(text.upper())], (hex(version), text))
+                self.assertEqual([([h.ext_text for h in item.headings], r) for item, r in m.lookup(u"COLOR")],
+                                 [([u"color"], u"цвет")])
+                # last article: next reference unknown
+                self.assertEqual([r for h, r in m.lookup(u"zzz")], [u"sleep"])
+                self.assertEqual(m.lookup(u""), [])
+                self.assertEqual(m.lookup(u"zzzz"), [])
+                # only the pages for the word decoded
+                self.assertFalse(m.headings_readed)
+                self.assertEqual(len(m.headings), 0)
+
+
+class TestIterArticles(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        entries = lsdwriter.random_corpus(100, seed=8) + [([u"colour", u"color"], u"цвет")]
+        self.filename = make_dict(self.tmp, 0x151005, entries, name=u"Test")
+
+    def test_iter_articles(self):
+        with lsdfile.LsdFile(self.filename) as m:
+            m.parse()
+            expected = items(m)
+        with lsdfile.LsdFile(self.filename) as m:
+            found = [([h.ext_text for h in heading.headings], heading.reference, article)
+                     for heading, article in m.iter_articles()]
+            self.assertEqual(found, expected)
+            self.assertFalse(m.parsed)
+            self.assertEqual(m.dict, [])
+            # merged multi-heading article returned once
+            self.assertIn(([u"color", u"colour"], u"цвет"), [(hs, article) for hs, ref, article in found])
+
+    def test_lazy(self):
+        with lsdfile.LsdFile(self.filename) as m:
+            decoded = []
+            read_article = m.read_article
+
+            def counted(heading):
+                decoded.append(heading)
+                return read_article(heading)
+            m.read_article = counted
+            heading, article = next(m.iter_articles())
+            self.assertEqual(decoded, [heading])
+            self.assertEqual(article, read_article(heading))
+
+    def test_write_dsl(self):
+        outputs = []
+        for parse in (True, False):
+            path = os.path.join(self.tmp, "parsed" if parse else "streamed")
+            os.mkdir(path)
+            with lsdfile.LsdFile(self.filename) as m:
+                if parse:
+                    m.parse()
+                m.write_dsl(path)
+                self.assertEqual(len(m.dict) > 0, parse)
+                with open(m.make_filename(path, "dsl"), 'rb') as f:
+                    outputs.append(f.read())
+        self.assertEqual(outputs[1], outputs[0])
+
+
+class TestParallel(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        entries = lsdwriter.random_corpus(400, seed=9) + [([u"colour", u"color"], u"цвет")]
+        self.filename = make_dict(self.tmp, 0x142001, entries)
+
+    def test_headings(self):
+        with lsdfile.LsdFile(self.filename) as m:
+            m.parse_headings()
+            expected = headings(m)
+            appended = m.headings.appended
+        with lsdfile.LsdFile(self.filename) as m:
+            self.assertGreater(m.pages_count, 2)
+            m.parse_headings(jobs=2)
+            self.assertEqual(headings(m), expected)
+            self.assertEqual(m.headings.appended, appended)
+            self.assertIn([u"color", u"colour"], [hs for hs, ref, next_ref in expected])
+
+    def test_pages_order(self):
+        with lsdfile.LsdFile(self.filename) as m:
+            m.read()
+            expected = [[h.reference for h in m.read_page(i)] for i in range(m.pages_count)]
+            found = [[h.reference for h in page] for page in parallel.iter_pages(m, 3, chunk_size=1)]
+            self.assertEqual(found, expected)
+
+    def test_articles(self):
+        with lsdfile.LsdFile(self.filename) as m:
+            m.parse()
+            expected = items(m)
+        with lsdfile.LsdFile(self.filename) as m:
+            m.parse(jobs=2)
+            self.assertEqual(items(m), expected)
+
+    def test_entries_count(self):
+        with lsdfile.LsdFile(self.filename) as m:
+            m.header.entries_count += 1
+            self.assertRaises(lsdfile.LsdError, m.parse_headings, 2)
+
+
+def rewrite_pages(filename, transform):
+    """ replace the 512 bytes pages of the not xored dictionary with the transform(pages) """
+    with open(filename, 'rb') as f:
+        data = bytearray(f.read())
+    fields = struct.unpack_from('<9L', data, 8)
+    annotation_offset, pages_offset = fields[4], fields[7]
+    pages = [bytes(data[i:i + 512]) for i in range(pages_offset, len(data), 512)]
+    data[pages_offset:] = b"".join(transform(pages))
+    # pages end and overlay in the dictionary info
+    struct.pack_into('<LL', data, annotation_offset - 16, len(data), len(data))
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def page_header(page):
+    return lsdfile.CachePage(BitStream(bytearray(page)))
+
+
+def renumbered(page, numbers):
+    """ page with the header page numbers changed by the numbers dict """
+    h = page_header(page)
+    header = lsdwriter.LsdWriter._page_header(h.is_leaf, numbers.get(h.number, h.number),
+                                              numbers.get(h.prev, h.prev), numbers.get(h.parent, h.parent),
+                                              numbers.get(h.next, h.next), h.headings_count).getvalue()
+    return header + page[len(header):]
+
+
+class TestPageSearch(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.entries = lsdwriter.random_corpus(600, seed=5)
+
+    def write_dictionary(self, **kwargs):
+        self.filename = make_dict(self.tmp, 0x142001, self.entries, **kwargs)
+        with lsdfile.LsdFile(self.filename) as m:
+            m.parse_headings()
+            self.texts = [h.text for item in m.headings for h in item.headings]
+            self.found = {}
+            for item in m.headings:
+                article = m.read_article(item)
+                for key in set(h.text.lower() for h in item.headings):
+                    self.found.setdefault(key, []).append(article)
+
+    def check_lookup(self, m, step=1):
+        for text in self.texts[::step]:
+            self.assertEqual(sorted(r for h, r in m.lookup(text)), sorted(self.found[text.lower()]), text)
+        self.assertEqual(m.lookup(u"missing"), [])
+
+    def decoded_pages(self, m, word):
+        pages = []
+        read_page = m._cursor.read_page
+
+        def counted(page_number):
+            pages.append(page_number)
+            return read_page(page_number)
+        m._cursor.read_page = counted
+        m.lookup(word)
+        m._cursor.read_page = read_page
+        return pages
+
+    def test_descend(self):
+        self.write_dictionary(fanout=3)
+        with lsdfile.LsdFile(self.filename) as m:
+            tree = m._cursor.page_tree()
+            self.assertGreater(len(tree.leaves), 4)
+            self.assertGreater(m.pages_count, len(tree.leaves))
+            # internal pages: empty, not the leaves
+            self.assertEqual(m.read_page(m.pages_count - 1), [])
+            self.assertNotIn(m.pages_count - 1, tree.leaves)
+            # root -> internal pages -> leaves
+            self.assertIsNotNone(tree.root[0][1][0][1])
+            self.check_lookup(m)
+            # missing words between the headings: only the pages around the key decoded
+            for text in self.texts[::50]:
+                self.assertLessEqual(len(self.decoded_pages(m, text + u"zz")), 2)
+            self.assertIsNone(m.pages_sorted)
+            self.assertEqual([h.text for item in m.prefix_search(u"", None) for h in item.headings], self.texts)
+
+    def test_leaves_order(self):
+        # leaf pages stored not in the dictionary order: found by the next links
+        self.write_dictionary(fanout=4)
+
+        def transform(pages):
+            order = list(range(len(pages)))
+            random.Random(1).shuffle(order)
+            # page with the number n written at the position of order[n]
+            res = [None] * len(pages)
+            for number, page in enumerate(pages):
+                res[order[number]] = renumbered(page, dict(enumerate(order)))
+            return res
+        rewrite_pages(self.filename, transform)
+        with lsdfile.LsdFile(self.filename) as m:
+            self.check_lookup(m)
+            self.assertIsNone(m.pages_sorted)
+            self.assertEqual([h.text for item in m.prefix_search(u"", None) for h in item.headings], self.texts)
+
+    def test_other_collation(self):
+        # headings not in the heading_key order: found by the pages scan
+        self.write_dictionary(sort_key=lambda text: text[::-1].lower())
+        with lsdfile.LsdFile(self.filename) as m:
+            self.check_lookup(m, 4)
+            self.assertIs(m.pages_sorted, False)
+            for text in self.texts[::20]:
+                prefix = text[:2].lower()
+                expected = [t for t in self.texts if t.lower().startswith(prefix)]
+                found = [h.text for item in m.prefix_search(prefix, None) for h in item.headings]
+                self.assertEqual(sorted(found), sorted(expected), prefix)
+
+
+class TestMmap(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.entries = lsdwriter.random_corpus(100, seed=6)
+
+    def write_dictionary(self, version):
+        return make_dict(self.tmp, version, self.entries, annotation=u"annotation")
+
+    def test_parse(self):
+        for version in (0x142001, 0x151005):
+            filename = self.write_dictionary(version)
+            with open(filename, 'rb') as f:
+                data = f.read()
+            with lsdfile.LsdFile(filename) as m:
+                m.parse()
+                expected = items(m)
+            with lsdfile.LsdFile(filename, use_mmap=True) as m:
+                self.assertIsInstance(m.bstr.record, mmap.mmap)
+                m.parse()
+                self.assertEqual(items(m), expected)
+                self.assertEqual(m.read_annotation(), u"annotation")
+            # x6 blocks decoded to the copies, file not changed
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_close(self):
+        filename = self.write_dictionary(0x142001)
+        m = lsdfile.LsdFile(filename, use_mmap=True)
+        for option in ('sequential', 'random', 'normal', 'unknown'):
+            m.advise(option)
+        m.close()
+        self.assertIsNone(m._mmap)
+        m.close()
+        m.advise('random')
+        # not mapped: nothing to advise
+        with lsdfile.LsdFile(filename) as m:
+            self.assertIsNone(m._mmap)
+            m.advise('sequential')
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+from unittest import TestCase
+from lingvoreader import lsdreader, lsdwriter
+from test.helpers import temp_dir, make_dict
+
+__author__ = 'sv99'
+
+
+class Output(list):
+    """ stdout lines """
+    def write(self, data):
+        self.append(data)
+
+    def flush(self):
+        pass
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.tmp = temp_dir(self)
+        self.out = os.path.join(self.tmp, "out")
+        os.mkdir(self.out)
+        self.dicts = [make_dict(self.tmp, version, lsdwriter.random_corpus(50, seed=version), name=u"Test")
+                      for version in (0x142001, 0x151005)]
+        # truncated dictionary
+        self.bad = os.path.join(self.tmp, "bad.lsd")
+        with open(self.dicts[0], 'rb') as f:
+            data = f.read()
+        with open(self.bad, 'wb') as f:
+            f.write(data[:200])
+
+    def batch(self, dicts):
+        output = Output()
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            res = lsdreader.batch(dicts, self.out, 2)
+        finally:
+            sys.stdout = stdout
+        return res, "".join(output)
+
+    def test_failed_not_stopped(self):
+        res, output = self.batch([self.dicts[0], self.bad, self.dicts[1]])
+        self.assertEqual(res, 1)
+        dsl_files = sorted(name for name in os.listdir(self.out) if name.endswith(".dsl"))
+        self.assertEqual(dsl_files, ["d142001.dsl", "d151005.dsl"])
+        for name in dsl_files:
+            self.assertGreater(os.path.getsize(os.path.join(self.out, name)), 1000)
+        for filename in self.dicts:
+            self.assertIn("%s: OK" % filename, output)
+        self.assertIn("%s: Error: " % self.bad, output)
+        self.assertIn("Unpacked 2 from 3, failed 1: ", output)
+        self.assertIn(" MB/s)", output)
+
+    def test_ok(self):
+        res, output = self.batch(self.dicts)
+        self.assertEqual(res, 0)
+        self.assertIn("Unpacked 2 from 2, failed 0: ", output)
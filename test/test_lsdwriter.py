@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from lingvoreader import lsdwriter, compress
+from lingvoreader.lsdfile import LsdFile, units_bytes
+from test.helpers import make_dict
+
+__author__ = 'sv99'
+
+
+ENTRIES = 200
+
+
+def expected_items(entries):
+    """ [(headings ext texts, article)] in the dictionary order """
+    res = []
+    for headings, article in entries:
+        res.append((sorted(headings, key=lambda h: (h.lower(), h)), article))
+    res.sort(key=lambda item: (item[0][0].lower(), item[0][0]))
+    return res
+
+
+def decoded_items(items):
+    return [([h.ext_text for h in heading.headings], article) for heading, article in items]
+
+
+class TestLsdWriter(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.entries = lsdwriter.random_corpus(ENTRIES, seed=1)
+        cls.files = {}
+        for version in lsdwriter.SUPPORTED_VERSIONS:
+            cls.files[version] = make_dict(cls.tmp, version, cls.entries,
+                                           name=u"Test", annotation=u"Test annotation")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_versions(self):
+        expected = expected_items(self.entries)
+        for version, filename in self.files.items():
+            with LsdFile(filename) as m:
+                self.assertEqual(m.header.version, version)
+                self.assertEqual(m.name, u"Test")
+                m.parse()
+                self.assertEqual(m.read_annotation(), u"Test annotation")
+                self.assertEqual(decoded_items(m.dict), expected, hex(version))
+
+    def test_long_article(self):
+        # size over 0xFFFF written in the 32 bits
+        article = u" ".join(u"word%d" % (i % 5000) for i in range(12000))
+        for version in (0x142001, 0x151005):
+            filename = make_dict(self.tmp, version, [(u"long", article), (u"short", u"text")],
+                                 filename="long%x.lsd" % version)
+            with LsdFile(filename) as m:
+                self.assertEqual([r for h, r in m.lookup(u"long")], [article])
+
+    def test_lookup(self):
+        headings, article = self.entries[10]
+        for use_mmap in (False, True):
+            with LsdFile(self.files[0x151005], use_mmap=use_mmap) as m:
+                found = m.lookup(headings[0])
+                self.assertEqual([r for h, r in found], [article])
+
+    def test_units(self):
+        with LsdFile(self.files[0x155001]) as m:
+            m.parse_headings()
+            for h in m.headings:
+                self.assertEqual(units_bytes(m.read_article_units(h)), m.read_article(h).encode('utf-16-le'))
+
+    def test_units_non_bmp(self):
+        # surrogate pairs in the streamed dsl
+        article = u"text \U00020000 wide"
+        for version in (0x131001, 0x141004, 0x151005):
+            filename = make_dict(self.tmp, version, [(u"wide", article), (u"other", u"plain text")],
+                                 filename="wide%x.lsd" % version)
+            path = os.path.join(self.tmp, "wide%x" % version)
+            os.mkdir(path)
+            with LsdFile(filename) as m:
+                m.parse_headings()
+                h = [item for item in m.headings if item.get_first().text == u"wide"][0]
+                self.assertEqual(units_bytes(m.read_article_units(h)), article.encode('utf-16-le'))
+                m.write(path)
+                with open(m.make_filename(path, "dsl"), 'rb') as f:
+                    self.assertIn(u"\t" + article, f.read().decode('utf-16'))
+
+    def test_dsl(self):
+        outputs = []
+        dsl_files = []
+        for depth, fmt in ((0, None), (4, None), (0, compress.GZIP)):
+            path = os.path.join(self.tmp, "dsl%d%s" % (depth, fmt))
+            os.mkdir(path)
+            with LsdFile(self.files[0x131001]) as m:
+                m.write(path, queue_depth=depth, compress=fmt)
+                dsl_file = m.make_filename(path, "dsl")
+            dsl_files.append(dsl_file)
+            if fmt is None:
+                with open(dsl_file, 'rb') as f:
+                    outputs.append(f.read())
+            else:
+                with gzip.open(dsl_file + '.' + fmt, 'rb') as f:
+                    outputs.append(f.read())
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+        # dsl encoded again
+        props, entries = lsdwriter.read_dsl(dsl_files[0])
+        self.assertEqual(props["NAME"], u"Test")
+        self.assertEqual(expected_items(entries), expected_items(self.entries))
+
+    def test_prefix_search(self):
+        headings = sorted((h for hs, article in self.entries for h in hs), key=lambda h: (h.lower(), h))
+        prefix = headings[50][:2]
+        expected = [h for h in headings if h.lower().startswith(prefix.lower())]
+        articles = dict((h, article) for hs, article in self.entries for h in hs)
+        for version in (0x131001, 0x151005):
+            for use_index in (False, True):
+                with LsdFile(self.files[version], use_index=use_index) as m:
+                    if use_index:
+                        m.build_index()
+                    for limit in (1, 3, None):
+                        found = m.prefix_search(prefix.upper(), limit)
+                        texts = [h.ext_text for item in found for h in item.headings]
+                        self.assertEqual(texts, expected[:limit], (hex(version), use_index, limit))
+                        for item in found:
+                            self.assertEqual(m.read_article(item), articles[item.get_first_ext_text()])
+                    self.assertEqual(len(m.prefix_search(u"zzzz")), 0)
+
+    def test_cursors(self):
+        articles = dict((h, article) for hs, article in self.entries for h in hs)
+        for version in (0x142001, 0x151005):
+            for use_index in (False, True):
+                with LsdFile(self.files[version], use_mmap=True, use_index=use_index) as m:
+                    if use_index:
+                        m.build_index()
+                    errors = []
+
+                    def work(start):
+                        cursor = m.cursor()
+                        for hs, article in self.entries[start::4]:
+                            found = cursor.lookup(hs[0])
+                            if [r for h, r in found] != [article]:
+                                errors.append(hs[0])
+                            for item in cursor.prefix_search(hs[0], 2):
+                                if cursor.read_article(item) != articles[item.get_first_ext_text()]:
+                                    errors.append(hs[0])
+                    threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+                    self.assertEqual(errors, [], (hex(version), use_index))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import time
+from unittest import TestCase
+from lingvoreader import pipeline
+
+__author__ = 'sv99'
+
+
+class SlowFile(io.BytesIO):
+    def write(self, data):
+        time.sleep(0.01)
+        return io.BytesIO.write(self, data)
+
+
+class FlushCounter(io.BytesIO):
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestPipelineWriter(TestCase):
+    def write(self, fp, items, encode=lambda item: item, depth=4, batch_size=10):
+        writer = pipeline.PipelineWriter(fp, encode, depth, batch_size)
+        writer.start()
+        for item in items:
+            writer.put(item)
+        writer.close()
+        return writer.stats
+
+    def test_order(self):
+        fp = io.BytesIO()
+        items = [str(i).encode() for i in range(1000)]
+        stats = self.write(fp, items)
+        self.assertEqual(fp.getvalue(), b"".join(items))
+        self.assertEqual(stats.items, 1000)
+        self.assertEqual(stats.bytes, len(fp.getvalue()))
+
+    def test_batches(self):
+        fp = io.BytesIO()
+        stats = self.write(fp, [b"12345"] * 5, batch_size=10)
+        # two full batches and the rest
+        self.assertEqual(stats.batches, 3)
+
+    def test_not_flushed(self):
+        # batches written only, compressed output flushed on close
+        fp = FlushCounter()
+        stats = self.write(fp, [b"12345"] * 20, batch_size=10)
+        self.assertEqual(stats.batches, 10)
+        self.assertEqual(fp.flushes, 0)
+        self.assertEqual(fp.getvalue(), b"12345" * 20)
+
+    def test_stalls(self):
+        # decoding waits for the slow output
+        stats = self.write(SlowFile(), [b"1234567890"] * 20, depth=2)
+        self.assertTrue(stats.put_stalls > 0)
+        self.assertTrue(stats.put_stall_time > 0)
+
+    def test_error(self):
+        def encode(item):
+            if item == b"bad":
+                raise ValueError("bad item")
+            return item
+        fp = io.BytesIO()
+        with self.assertRaises(ValueError):
+            self.write(fp, [b"1", b"bad"] + [b"2"] * 100, encode)
+
+    def test_error_not_queued(self):
+        # queue not full: writer error raised before the next item queued
+        writer = pipeline.PipelineWriter(io.BytesIO(), lambda item: item.encode(), depth=100)
+        writer.start()
+        writer.put(None)
+        writer.join()
+        self.assertIsInstance(writer.error, AttributeError)
+        with self.assertRaises(AttributeError):
+            writer.put(b"1")
+        self.assertEqual(writer._queue.qsize(), 0)
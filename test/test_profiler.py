@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from lingvoreader import profiler
+
+__author__ = 'sv99'
+
+
+class FakeClock:
+    """ wall and cpu timers advanced by sleep only """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestProfile(TestCase):
+    def setUp(self):
+        self.timers = profiler.timer, profiler.cpu_timer
+        self.clock = FakeClock()
+        profiler.timer = profiler.cpu_timer = self.clock
+
+    def tearDown(self):
+        profiler.timer, profiler.cpu_timer = self.timers
+
+    def test_nested(self):
+        p = profiler.Profile()
+        with p.stage('write'):
+            self.clock.sleep(2)
+            with p.stage('articles'):
+                self.clock.sleep(5)
+            self.clock.sleep(1)
+        # articles time excluded
+        self.assertEqual(p.stages['write'], [1, 3.0, 3.0])
+        self.assertEqual(p.stages['articles'], [1, 5.0, 5.0])
+        self.assertEqual(p.stages['header'][0], 0)
+
+    def test_callback(self):
+        events = []
+        p = profiler.Profile(lambda name, wall, cpu: events.append(name))
+        with p.stage('headings'):
+            pass
+        self.assertEqual(events, ['headings'])
+
+    def test_iterate(self):
+        def items():
+            for i in range(3):
+                self.clock.sleep(1)
+                yield i
+            # end of the items timed too
+            self.clock.sleep(1)
+        p = profiler.Profile()
+        self.assertEqual(list(p.iterate('articles', items())), [0, 1, 2])
+        self.assertEqual(p.stages['articles'], [3, 4.0, 4.0])
+        self.assertEqual(p._stack, [])
+        self.assertEqual(list(p.iterate('headings', [])), [])
+        self.assertEqual(p.stages['headings'][0], 0)
+
+    def test_iterate_error(self):
+        def items():
+            yield 1
+            raise ValueError()
+        p = profiler.Profile()
+        with self.assertRaises(ValueError):
+            list(p.iterate('articles', items()))
+        self.assertEqual(p.stages['articles'][0], 2)
+        self.assertEqual(p._stack, [])
+
+    def test_error(self):
+        p = profiler.Profile()
+        with self.assertRaises(ValueError):
+            with p.stage('decoder'):
+                raise ValueError()
+        self.assertEqual(p.stages['decoder'][0], 1)
+        self.assertEqual(p._stack, [])
+
+    def test_counters(self):
+        p = profiler.Profile()
+        p.count('bits', 10)
+        p.count('bits', 5)
+        res = p.as_dict()
+        self.assertEqual(res['counters']['bits'], 15)
+        self.assertEqual(res['counters']['symbols'], 0)
+        self.assertEqual(sorted(res['stages']['write']), ['calls', 'cpu', 'wall'])